@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import getopt
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from generate import Extractor, Options, LibraryCatalogue
+from synthetic import write_page_txts, write_library
+from results import save_results
+
+
+def time_repeatedly(function, repeat_count: int, prepare=None) -> dict:
+    # the best of a few runs is the least noisy figure to compare commits by
+    times = list[float]()
+    for _ in range(repeat_count):
+        if prepare is not None:
+            prepare()
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+    return {"best_time": min(times), "times": times}
+
+
+def benchmark_publication(
+    folder_path: str, page_count: int, words_per_page: int, repeat_count: int
+) -> dict:
+    write_page_txts(folder_path, page_count, words_per_page)
+    results = dict[str, dict]()
+
+    def calculate_word_frequencies():
+        Extractor().calculate_word_frequencies_by_page(folder_path)
+
+    def find_isbns():
+        Extractor().find_isbns(folder_path)
+
+    def generate_pdf_search():
+        Extractor().generate_pdf_search(folder_path)
+
+    print("Timing calculate_word_frequencies_by_page")
+    results["calculate_word_frequencies_by_page"] = time_repeatedly(
+        calculate_word_frequencies, repeat_count
+    )
+    print("Timing find_isbns")
+    results["find_isbns"] = time_repeatedly(find_isbns, repeat_count)
+    print("Timing generate_pdf_search")
+    results["generate_pdf_search"] = time_repeatedly(generate_pdf_search, repeat_count)
+    return results
+
+
+def benchmark_library(
+    output_root_path: str, publication_count: int, repeat_count: int
+) -> dict:
+    write_library(output_root_path, publication_count)
+    options = Options()
+    options.output_root_path = output_root_path
+    structure_file_path = os.path.join(output_root_path, LibraryCatalogue.file_name)
+    catalogue_folder_path = os.path.join(output_root_path, LibraryCatalogue.folder_name)
+
+    def remove_structure():
+        if os.path.exists(structure_file_path):
+            os.remove(structure_file_path)
+        shutil.rmtree(catalogue_folder_path, ignore_errors=True)
+
+    def generate_structure():
+        Extractor().generate_structure(options)
+
+    results = dict[str, dict]()
+    print("Timing generate_structure")
+    # from nothing, then again with an up to date catalogue in place
+    results["generate_structure_cold"] = time_repeatedly(
+        generate_structure, repeat_count, remove_structure
+    )
+    results["generate_structure_warm"] = time_repeatedly(generate_structure, repeat_count)
+    return results
+
+
+if __name__ == "__main__":
+    page_count = 1000
+    words_per_page = 2000
+    publication_count = 5000
+    repeat_count = 3
+    results_file_path = None
+    usage = "functions.py [-p <pages>] [-w <words per page>] [-l <publications>] [-r <repeats>] [-o <results.json>]"
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hp:w:l:r:o:")
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            print(usage)
+            sys.exit()
+        elif opt == "-p":
+            page_count = int(arg)
+        elif opt == "-w":
+            words_per_page = int(arg)
+        elif opt == "-l":
+            publication_count = int(arg)
+        elif opt == "-r":
+            repeat_count = max(1, int(arg))
+        elif opt == "-o":
+            results_file_path = arg
+
+    working_folder_path = tempfile.mkdtemp()
+    try:
+        publication_folder_path = os.path.join(working_folder_path, "publication")
+        os.makedirs(publication_folder_path)
+        library_folder_path = os.path.join(working_folder_path, "library")
+        os.makedirs(library_folder_path)
+
+        results = {
+            "parameters": {
+                "pages": page_count,
+                "words_per_page": words_per_page,
+                "publications": publication_count,
+                "repeats": repeat_count,
+            }
+        }
+        results.update(
+            benchmark_publication(
+                publication_folder_path, page_count, words_per_page, repeat_count
+            )
+        )
+        results.update(benchmark_library(library_folder_path, publication_count, repeat_count))
+    finally:
+        shutil.rmtree(working_folder_path)
+
+    for name, result in results.items():
+        if "best_time" in result:
+            print("".join([name.ljust(40), format(result["best_time"], ".4f"), "s"]))
+    save_results("functions", results, results_file_path)
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import getopt
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from generate import Extractor, Options, Scheduler
+from synthetic import page_kinds, write_pdf
+from results import save_results
+
+
+def benchmark_extract(
+    options: Options, pdf_file_path: str, output_folder_path: str
+) -> dict:
+    # a fresh scheduler each time so no engine, cache or report carries over
+    scheduler = Scheduler(options)
+    start_time = time.perf_counter()
+    try:
+        Extractor(scheduler).extract(options, pdf_file_path, output_folder_path)
+    finally:
+        scheduler.shutdown()
+    wall_time = time.perf_counter() - start_time
+
+    report = scheduler.run_report.describe()
+    publication_folder = os.path.basename(output_folder_path)
+    publication = report["publications"][publication_folder]
+    return {
+        "wall_time": wall_time,
+        "cpu_time": report["cpu_time"],
+        "subprocess_cpu_time": report["subprocess_cpu_time"],
+        "subprocesses": report["subprocesses"],
+        "bytes_written": publication["bytes_written"],
+        "peak_disk_bytes": publication["peak_disk_bytes"],
+        "stages": publication["stages"],
+    }
+
+
+if __name__ == "__main__":
+    kinds = list(page_kinds)
+    page_counts = [10, 100]
+    repeat_count = 1
+    options = Options()
+    results_file_path = None
+    usage = "pipeline.py [-k <text,scanned,mixed>] [-s <10,100,1000>] [-j <jobs>] [-r <repeats>] [-o <results.json>]"
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hk:s:j:r:o:")
+    except getopt.GetoptError:
+        print(usage)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt == "-h":
+            print(usage)
+            sys.exit()
+        elif opt == "-k":
+            kinds = [kind for kind in arg.split(",") if kind in page_kinds]
+        elif opt == "-s":
+            page_counts = [int(page_count) for page_count in arg.split(",")]
+        elif opt == "-j":
+            options.job_count = max(1, int(arg))
+        elif opt == "-r":
+            repeat_count = max(1, int(arg))
+        elif opt == "-o":
+            results_file_path = arg
+
+    # every run has to do the full amount of work, and stay off the network
+    options.use_ocr_cache = False
+    options.generate_meta_from_isbn = False
+
+    working_folder_path = tempfile.mkdtemp()
+    results = {
+        "parameters": {
+            "kinds": kinds,
+            "pages": page_counts,
+            "jobs": options.job_count,
+            "repeats": repeat_count,
+        }
+    }
+    try:
+        input_folder_path = os.path.join(working_folder_path, "input")
+        os.makedirs(input_folder_path)
+        for kind in kinds:
+            for page_count in page_counts:
+                case_name = "".join([kind, "-", str(page_count)])
+                pdf_file_path = os.path.join(input_folder_path, "".join([case_name, ".pdf"]))
+                print("".join(["Generating ", case_name, ".pdf"]))
+                write_pdf(pdf_file_path, page_count, kind)
+
+                best_result = None
+                for _ in range(repeat_count):
+                    output_root_path = os.path.join(working_folder_path, "output")
+                    shutil.rmtree(output_root_path, ignore_errors=True)
+                    options.output_root_path = output_root_path
+                    output_folder_path = os.path.join(output_root_path, case_name)
+                    os.makedirs(output_folder_path)
+
+                    result = benchmark_extract(options, pdf_file_path, output_folder_path)
+                    if best_result is None or result["wall_time"] < best_result["wall_time"]:
+                        best_result = result
+                results[case_name] = best_result
+    finally:
+        shutil.rmtree(working_folder_path)
+
+    for case_name, result in results.items():
+        if "wall_time" in result:
+            print("".join([case_name.ljust(20), format(result["wall_time"], ".2f"), "s"]))
+    save_results("pipeline", results, results_file_path)
@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import json
+import platform
+import datetime
+import subprocess
+
+bench_folder_path = os.path.dirname(os.path.abspath(__file__))
+results_folder_path = os.path.join(bench_folder_path, "results")
+
+
+def find_commit() -> list:
+    # [commit hash, whether the tree had uncommitted changes]
+    repository_path = os.path.dirname(bench_folder_path)
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=repository_path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        ).stdout.decode("utf-8").strip()
+        status = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"],
+            cwd=repository_path,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        ).stdout.decode("utf-8").strip()
+    except OSError:
+        return ["unknown", False]
+    if len(commit) == 0:
+        commit = "unknown"
+    return [commit, len(status) > 0]
+
+
+def describe_environment() -> dict:
+    commit, is_dirty = find_commit()
+    return {
+        "commit": commit,
+        "dirty": is_dirty,
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def save_results(suite_name: str, results: dict, results_file_path: str = None) -> str:
+    environment = describe_environment()
+    if results_file_path is None:
+        results_file_name = "".join([suite_name, "-", environment["commit"][:12], ".json"])
+        results_file_path = os.path.join(results_folder_path, results_file_name)
+    results_folder = os.path.dirname(os.path.abspath(results_file_path))
+    os.makedirs(results_folder, exist_ok=True)
+    with open(results_file_path, "w") as results_file:
+        json.dump(
+            {"suite": suite_name, "environment": environment, "results": results},
+            results_file,
+            indent=2,
+            sort_keys=True,
+        )
+    print("".join(["Results written to ", results_file_path]))
+    return results_file_path
+
+
+def flatten_timings(results: dict, prefix: str = "") -> dict[str, float]:
+    # every number that ends in _time, keyed by its path through the results
+    timings = dict[str, float]()
+    for key, value in results.items():
+        path = "".join([prefix, "/", key]) if len(prefix) > 0 else key
+        if isinstance(value, dict):
+            timings.update(flatten_timings(value, path))
+        elif key.endswith("time") and isinstance(value, (int, float)):
+            timings[path] = value
+    return timings
+
+
+def compare_results(baseline_file_path: str, candidate_file_path: str) -> None:
+    with open(baseline_file_path, "r") as baseline_file:
+        baseline = json.load(baseline_file)
+    with open(candidate_file_path, "r") as candidate_file:
+        candidate = json.load(candidate_file)
+
+    print(
+        "".join(
+            [
+                baseline["environment"]["commit"][:12],
+                " -> ",
+                candidate["environment"]["commit"][:12],
+            ]
+        )
+    )
+    baseline_timings = flatten_timings(baseline["results"])
+    candidate_timings = flatten_timings(candidate["results"])
+    for path in sorted(baseline_timings.keys()):
+        if path not in candidate_timings:
+            continue
+        baseline_time = baseline_timings[path]
+        candidate_time = candidate_timings[path]
+        change_text = "n/a"
+        if baseline_time > 0:
+            change_text = "".join([format((candidate_time / baseline_time - 1) * 100, "+.1f"), "%"])
+        print(
+            "".join(
+                [
+                    path.ljust(60),
+                    format(baseline_time, ".4f").rjust(12),
+                    format(candidate_time, ".4f").rjust(12),
+                    change_text.rjust(10),
+                ]
+            )
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("results.py <baseline.json> <candidate.json>")
+        sys.exit(2)
+    compare_results(sys.argv[1], sys.argv[2])
@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+
+import os
+import random
+import zlib
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+page_kinds = ["text", "scanned", "mixed"]
+
+page_width_points = 612
+page_height_points = 792
+# scanned pages are stored at the sort of resolution a flatbed produces
+scan_resolution = 150
+
+
+def generate_vocabulary(word_count: int = 5000, seed: int = 0) -> list[str]:
+    generator = random.Random(seed)
+    vocabulary = list[str]()
+    for _ in range(word_count):
+        word_length = generator.randint(1, 12)
+        word = "".join(generator.choice("abcdefghijklmnopqrstuvwxyzABCDEF") for _ in range(word_length))
+        vocabulary.append(word)
+    vocabulary.extend(["ISBN-13:", "9780306406157", "$5", "@home.", "fox,", "Über", "naïve"])
+    return vocabulary
+
+
+def generate_page_lines(
+    generator: random.Random, vocabulary: list[str], word_count: int, words_per_line: int = 12
+) -> list[str]:
+    lines = list[str]()
+    line_words = list[str]()
+    for _ in range(word_count):
+        line_words.append(generator.choice(vocabulary))
+        if len(line_words) == words_per_line:
+            lines.append(" ".join(line_words))
+            line_words.clear()
+    if len(line_words) > 0:
+        lines.append(" ".join(line_words))
+    return lines
+
+
+def write_page_txts(
+    folder_path: str, page_count: int, words_per_page: int, seed: int = 0
+) -> None:
+    # a publication folder as it looks after ocr, one pageNNNN.txt per page
+    generator = random.Random(seed)
+    vocabulary = generate_vocabulary(seed=seed)
+    for page_index in range(page_count):
+        page_lines = generate_page_lines(generator, vocabulary, words_per_page)
+        if page_index == 1:
+            page_lines.append("ISBN-13: 978-0-306-40615-7")
+        page_txt_file_name = "".join(["page", str(page_index).zfill(4), ".txt"])
+        page_txt_file_path = os.path.join(folder_path, page_txt_file_name)
+        with open(page_txt_file_path, "w") as page_txt_file:
+            page_txt_file.write("\n".join(page_lines))
+
+
+def write_library(output_root_path: str, publication_count: int) -> None:
+    # just enough of a generated site for the library catalogue to find
+    for publication_index in range(publication_count):
+        publication_folder = "".join(["publication", str(publication_index).zfill(5)])
+        publication_folder_path = os.path.join(output_root_path, publication_folder)
+        os.makedirs(publication_folder_path, exist_ok=True)
+        structure_file_path = os.path.join(publication_folder_path, "structure.json")
+        with open(structure_file_path, "w") as structure_file:
+            structure_file.write('{\n  "pages" : [\n    { "file" : "page0000.jpg" }\n  ]\n}\n')
+
+
+def escape_pdf_text(text: str) -> str:
+    # the standard fonts only cover latin-1
+    safe_text = text.encode("latin-1", "replace").decode("latin-1")
+    return safe_text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def build_text_content(page_lines: list[str]) -> bytes:
+    content_lines = ["BT", "/F1 11 Tf", "14 TL", "72 720 Td"]
+    for page_line in page_lines:
+        content_lines.append("".join(["(", escape_pdf_text(page_line), ") Tj T*"]))
+    content_lines.append("ET")
+    return "\n".join(content_lines).encode("latin-1")
+
+
+def build_scanned_pixels(page_lines: list[str]) -> list:
+    # [width, height, 8 bit grey pixels]
+    width = page_width_points * scan_resolution // 72
+    height = page_height_points * scan_resolution // 72
+    margin = scan_resolution
+    line_height = scan_resolution // 5
+
+    if Image is not None:
+        page_image = Image.new("L", (width, height), 255)
+        page_draw = ImageDraw.Draw(page_image)
+        try:
+            page_font = ImageFont.load_default(size=line_height * 3 // 4)
+        except TypeError:
+            page_font = ImageFont.load_default()
+        for line_index, page_line in enumerate(page_lines):
+            line_top = margin + line_index * line_height
+            if line_top + line_height > height - margin:
+                break
+            page_draw.text((margin, line_top), page_line, fill=0, font=page_font)
+        return [width, height, page_image.tobytes()]
+
+    # without Pillow each word becomes a dark block the size it would be in
+    # print, which keeps the image the same size and about as compressible
+    character_width = line_height // 2
+    ink_height = line_height * 3 // 5
+    blank_row = b"\xff" * width
+    pixel_rows = list[bytes]()
+    for _ in range(margin):
+        pixel_rows.append(blank_row)
+    for page_line in page_lines:
+        if len(pixel_rows) + line_height > height - margin:
+            break
+        ink_row = bytearray(blank_row)
+        word_left = margin
+        for word in page_line.split():
+            word_right = min(width - margin, word_left + len(word) * character_width)
+            ink_row[word_left:word_right] = b"\x00" * max(0, word_right - word_left)
+            word_left = word_right + character_width
+            if word_left >= width - margin:
+                break
+        for _ in range(ink_height):
+            pixel_rows.append(bytes(ink_row))
+        for _ in range(line_height - ink_height):
+            pixel_rows.append(blank_row)
+    while len(pixel_rows) < height:
+        pixel_rows.append(blank_row)
+    return [width, height, b"".join(pixel_rows)]
+
+
+def write_pdf(pdf_file_path: str, page_count: int, page_kind: str, seed: int = 0) -> None:
+    # text pages carry a real text layer, scanned pages are a single image
+    # and mixed alternates between the two
+    generator = random.Random(seed)
+    vocabulary = generate_vocabulary(seed=seed)
+
+    objects = list[bytes]()
+
+    def add_object(object_data: bytes) -> int:
+        objects.append(object_data)
+        return len(objects)
+
+    def add_stream(dictionary: str, stream_data: bytes) -> int:
+        header = "".join(["<< ", dictionary, " /Length ", str(len(stream_data)), " >>\nstream\n"])
+        return add_object(b"".join([header.encode("latin-1"), stream_data, b"\nendstream"]))
+
+    catalog_object_number = add_object(b"")
+    pages_object_number = add_object(b"")
+    font_object_number = add_object(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_object_numbers = list[int]()
+    for page_index in range(page_count):
+        page_lines = generate_page_lines(generator, vocabulary, 300)
+        if page_index == 1:
+            page_lines.insert(0, "ISBN-13: 978-0-306-40615-7")
+
+        is_scanned = page_kind == "scanned" or (page_kind == "mixed" and page_index % 2 == 0)
+        if is_scanned:
+            width, height, pixels = build_scanned_pixels(page_lines)
+            image_object_number = add_stream(
+                "".join(
+                    [
+                        "/Type /XObject /Subtype /Image /Width ",
+                        str(width),
+                        " /Height ",
+                        str(height),
+                        " /ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode",
+                    ]
+                ),
+                zlib.compress(pixels, 6),
+            )
+            content = "".join(
+                ["q ", str(page_width_points), " 0 0 ", str(page_height_points), " 0 0 cm /Im1 Do Q"]
+            ).encode("latin-1")
+            resources = "".join(["<< /XObject << /Im1 ", str(image_object_number), " 0 R >> >>"])
+        else:
+            content = build_text_content(page_lines)
+            resources = "".join(["<< /Font << /F1 ", str(font_object_number), " 0 R >> >>"])
+
+        content_object_number = add_stream("/Filter /FlateDecode", zlib.compress(content, 6))
+        page_object = "".join(
+            [
+                "<< /Type /Page /Parent ",
+                str(pages_object_number),
+                " 0 R /MediaBox [0 0 ",
+                str(page_width_points),
+                " ",
+                str(page_height_points),
+                "] /Resources ",
+                resources,
+                " /Contents ",
+                str(content_object_number),
+                " 0 R >>",
+            ]
+        )
+        page_object_numbers.append(add_object(page_object.encode("latin-1")))
+
+    objects[catalog_object_number - 1] = "".join(
+        ["<< /Type /Catalog /Pages ", str(pages_object_number), " 0 R >>"]
+    ).encode("latin-1")
+    page_references = " ".join("".join([str(number), " 0 R"]) for number in page_object_numbers)
+    objects[pages_object_number - 1] = "".join(
+        ["<< /Type /Pages /Kids [", page_references, "] /Count ", str(page_count), " >>"]
+    ).encode("latin-1")
+
+    with open(pdf_file_path, "wb") as pdf_file:
+        pdf_file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        object_offsets = list[int]()
+        for object_index, object_data in enumerate(objects):
+            object_offsets.append(pdf_file.tell())
+            pdf_file.write("".join([str(object_index + 1), " 0 obj\n"]).encode("latin-1"))
+            pdf_file.write(object_data)
+            pdf_file.write(b"\nendobj\n")
+
+        xref_offset = pdf_file.tell()
+        pdf_file.write("".join(["xref\n0 ", str(len(objects) + 1), "\n"]).encode("latin-1"))
+        pdf_file.write(b"0000000000 65535 f \n")
+        for object_offset in object_offsets:
+            pdf_file.write("".join([str(object_offset).zfill(10), " 00000 n \n"]).encode("latin-1"))
+        trailer = "".join(
+            [
+                "trailer\n<< /Size ",
+                str(len(objects) + 1),
+                " /Root ",
+                str(catalog_object_number),
+                " 0 R >>\nstartxref\n",
+                str(xref_offset),
+                "\n%%EOF\n",
+            ]
+        )
+        pdf_file.write(trailer.encode("latin-1"))
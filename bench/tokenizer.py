@@ -0,0 +1,78 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from generate import Extractor
+from synthetic import write_page_txts
+
+
+def legacy_count_words(page_txt_file_path: str) -> dict[str, int]:
+    # the per character loop calculate_word_frequencies_by_page used to run
+    with open(page_txt_file_path, "r") as page_txt_file:
+        page_txt_contents = page_txt_file.read()
+    words = page_txt_contents.split()
+    count_by_word = dict[str, int]()
+    for word in words:
+        lower_word = word.lower()
+        safe_word_characters = list[str]()
+        for character in lower_word:
+            if character in "abcdefghijklmnopqrstuvwxyz1234567890.,@$":
+                safe_word_characters.append(character)
+        safe_word = "".join(safe_word_characters)
+        if len(safe_word) > 0:
+            count = 0
+            if safe_word in count_by_word:
+                count = count_by_word[safe_word]
+            count += 1
+            count_by_word[safe_word] = count
+    return count_by_word
+
+
+def time_function(function) -> float:
+    start_time = time.perf_counter()
+    function()
+    return time.perf_counter() - start_time
+
+
+if __name__ == "__main__":
+    page_count = 1000
+    words_per_page = 2000
+    if len(sys.argv) > 1:
+        page_count = int(sys.argv[1])
+
+    with tempfile.TemporaryDirectory() as corpus_folder_path:
+        write_page_txts(corpus_folder_path, page_count, words_per_page)
+        extractor = Extractor()
+
+        def run_legacy():
+            for txt_stem_name in extractor.find_txt_stem_names(corpus_folder_path):
+                txt_file_name = "".join([txt_stem_name, ".txt"])
+                legacy_count_words(os.path.join(corpus_folder_path, txt_file_name))
+
+        def run_current():
+            extractor.calculate_word_frequencies_by_page(corpus_folder_path)
+
+        legacy_counts = dict()
+        for txt_stem_name in extractor.find_txt_stem_names(corpus_folder_path):
+            txt_file_name = "".join([txt_stem_name, ".txt"])
+            legacy_counts[txt_stem_name] = legacy_count_words(
+                os.path.join(corpus_folder_path, txt_file_name)
+            )
+        current_counts = extractor.calculate_word_frequencies_by_page(corpus_folder_path)
+        for txt_stem_name in legacy_counts.keys():
+            if legacy_counts[txt_stem_name] != dict(current_counts[txt_stem_name]):
+                print("".join(["Token mismatch on ", txt_stem_name]))
+                sys.exit(1)
+
+        legacy_time = time_function(run_legacy)
+        current_time = time_function(run_current)
+
+        print("".join(["Pages: ", str(page_count), " x ", str(words_per_page), " words"]))
+        print("".join(["Legacy tokenizer:  ", format(legacy_time, ".3f"), "s"]))
+        print("".join(["Current tokenizer: ", format(current_time, ".3f"), "s"]))
+        print("".join(["Speedup: ", format(legacy_time / current_time, ".1f"), "x"]))
@@ -1,16 +1,57 @@
 #!/usr/bin/python3
 
 from enum import Enum
+import abc
 import os
 import sys
 import getopt
 from pathlib import Path
 import subprocess
 import urllib.request
+import urllib.error
 import json
+import concurrent.futures
+import threading
+import io
+import hashlib
+import re
+import time
+import collections
+import struct
+import contextlib
+import cProfile
+import pstats
+import datetime
+import gzip
+import shutil
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:
+    Image = None
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 
 class Options:
+    imaging_backends = ["auto", "pillow", "convert"]
+    ocr_backends = ["auto", "tesserocr", "command"]
+    ocr_preprocess_modes = ["none", "grayscale", "binarise"]
+    image_format_names = ["jpg", "webp", "avif"]
+
     def __init__(self) -> None:
         self.ignore_existing_directories = True
         self.generate_pngs = True
@@ -24,6 +65,57 @@ class Options:
         self.generate_meta_from_isbn = True
         self.generate_meta_from_text = True
         self.cleanup_txts = True
+        self.job_count = os.cpu_count() or 1
+        self.publication_limit = 2
+        self.stream_pages = False
+        self.raster_chunk_page_count = 8
+        self.raw_page_limit = 16
+        self.imaging_backend = "auto"
+        self.ocr_backend = "auto"
+        self.ocr_language = "eng"
+        self.page_resolution = 300
+        # None keeps page images at whatever resolution the page was rendered at
+        self.image_resolution = None
+        self.adaptive_ocr = True
+        self.blank_page_ink_threshold = 0.001
+        # the height of a line of text tesseract reads best, in pixels
+        self.ocr_line_height = 48
+        self.minimum_ocr_resolution = 150
+        self.ocr_preprocess = "none"
+        self.use_text_layer = True
+        self.text_layer_threshold = 100
+        self.text_layer_resolution = 150
+        self.use_ocr_cache = True
+        self.ocr_cache_path = os.path.join(
+            os.path.expanduser("~"), ".cache", "librarygen", "ocr"
+        )
+        self.ocr_cache_size_limit = 512 * 1024 * 1024
+        self.generate_library_search = True
+        self.catalogue_chunk_size = 100
+        self.image_tier_widths = {"thumbnail": 240, "screen": 1280}
+        self.image_formats = ["jpg"]
+        self.isbn_lookup_url = "https://www.googleapis.com/books/v1/volumes?q=isbn:"
+        self.isbn_lookup_limit = 4
+        self.isbn_lookup_timeout = 10
+        self.isbn_lookup_retry_count = 2
+        self.use_isbn_cache = True
+        self.isbn_cache_path = os.path.join(
+            os.path.expanduser("~"), ".cache", "librarygen", "isbn.json"
+        )
+        # books the api didn't know about are asked about again after a week
+        self.isbn_negative_cache_age = 7 * 24 * 60 * 60
+        self.report_path = None
+        self.profile_path = None
+        self.disk_sample_interval = 1.0
+        self.minify_output = True
+        self.compress_output = True
+        # page images are given names that change with their contents, so
+        # they can be served with far future cache headers
+        self.hash_asset_names = False
+        self.watch = False
+        # how often the input folder is looked at, and how long a new PDF
+        # has to stay the same size before it is picked up
+        self.watch_interval = 5.0
         self.input_root_path = "test-input"
         self.output_root_path = "test-output"
 
@@ -45,94 +137,2194 @@ class RunnerResult:
         pass
 
 
+class ToolError(Exception):
+    # a command line tool that reported an error, carrying what it said so
+    # the publication it was working on can be reported and skipped
+    def __init__(self, line: list[str], error_text: str) -> None:
+        super().__init__("".join([line[0], " failed: ", error_text.strip()]))
+        self.line = line
+        self.error_text = error_text
+
+
 class Runner:
     def __init__(self) -> None:
         pass
 
-    def execute(self, line: list[str]) -> RunnerResult:
+    def execute(self, line: list[str], input_data: bytes = None) -> RunnerResult:
+        start_time = time.perf_counter()
         process_result = subprocess.run(
-            line, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            line, input=input_data, stdout=subprocess.PIPE, stderr=subprocess.PIPE
         )
+        RunReport.record_subprocess(time.perf_counter() - start_time)
         result = RunnerResult()
         result.output_text = process_result.stdout.decode("utf-8")
         result.error_text = process_result.stderr.decode("utf-8")
         return result
 
 
-class Extractor:
-    def __init__(self) -> None:
+class RunReport:
+    file_name = "report.json"
+    # only these are worth profiling, the rest of the time is spent waiting
+    # on subprocesses
+    python_stage_names = ["search", "structure", "meta", "library_search", "cleanup", "finalise"]
+    # the stage running on each thread, so Runner can charge its
+    # subprocesses to it
+    context = threading.local()
+
+    def __init__(self, options: Options) -> None:
+        self.lock = threading.Lock()
+        self.started_time = datetime.datetime.now().isoformat(timespec="seconds")
+        self.start_time = time.perf_counter()
+        self.start_cpu_time = time.process_time()
+        self.start_child_cpu_time = self.find_child_cpu_time()
+        self.stages_by_publication = dict[str, dict[str, dict]]()
+        # stages that belong to the run as a whole rather than to any one
+        # publication, like finding out which tools are installed
+        self.run_stages = dict[str, dict]()
+        self.publications = dict[str, dict]()
+        # publications let go of by a long running watch, kept only as part
+        # of the stage totals
+        self.retired_stage_totals = dict[str, dict]()
+        self.retired_publication_count = 0
+        self.active_output_folder_paths = dict[str, str]()
+        self.profile_path = options.profile_path
+        self.profiles = list[cProfile.Profile]()
+        # disk use is sampled, so very short lived peaks can be missed
+        self.sample_interval = options.disk_sample_interval
+        self.stop_sampling = threading.Event()
+        self.sampler = threading.Thread(target=self.sample_disk_use_until_stopped, daemon=True)
+        self.sampler.start()
+
+    def find_child_cpu_time(self) -> float:
+        if resource is None:
+            return 0.0
+        child_usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return child_usage.ru_utime + child_usage.ru_stime
+
+    @contextlib.contextmanager
+    def measure(self, publication_folder: str, stage_name: str):
+        # a publication_folder of None charges the stage to the run itself
+        stage = {
+            "calls": 1,
+            "wall_time": 0.0,
+            "cpu_time": 0.0,
+            "subprocesses": 0,
+            "subprocess_time": 0.0,
+        }
+        previous_stage = getattr(RunReport.context, "stage", None)
+        RunReport.context.stage = stage
+
+        profile = None
+        if self.profile_path is not None and stage_name in RunReport.python_stage_names:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:
+                # newer pythons only allow one profiler at a time
+                profile = None
+
+        start_time = time.perf_counter()
+        start_cpu_time = time.thread_time()
+        try:
+            yield
+        finally:
+            stage["cpu_time"] = time.thread_time() - start_cpu_time
+            stage["wall_time"] = time.perf_counter() - start_time
+            if profile is not None:
+                profile.disable()
+            RunReport.context.stage = previous_stage
+
+            with self.lock:
+                if profile is not None:
+                    self.profiles.append(profile)
+                if publication_folder is None:
+                    stages = self.run_stages
+                else:
+                    stages = self.stages_by_publication.setdefault(publication_folder, dict())
+                if stage_name not in stages:
+                    stages[stage_name] = stage
+                else:
+                    for measure_name in stage.keys():
+                        stages[stage_name][measure_name] += stage[measure_name]
+
+    @staticmethod
+    def record_subprocess(wall_time: float) -> None:
+        stage = getattr(RunReport.context, "stage", None)
+        if stage is None:
+            return
+        stage["subprocesses"] += 1
+        stage["subprocess_time"] += wall_time
+
+    def begin_publication(self, publication_folder: str, output_folder_path: str) -> None:
+        with self.lock:
+            # moved to the end, so a rebuilt publication counts as the newest
+            self.publications.pop(publication_folder, None)
+            self.publications[publication_folder] = {
+                "start_time": time.perf_counter(),
+                "wall_time": 0.0,
+                "final_bytes": 0,
+                "bytes_written": 0,
+                "peak_disk_bytes": 0,
+            }
+            self.active_output_folder_paths[publication_folder] = output_folder_path
+
+    def end_publication(self, publication_folder: str, reclaimed_byte_count: int) -> None:
+        self.sample_disk_use()
+        with self.lock:
+            publication = self.publications[publication_folder]
+            output_folder_path = self.active_output_folder_paths.pop(publication_folder)
+            publication["wall_time"] = time.perf_counter() - publication.pop("start_time")
+            publication["final_bytes"] = self.find_folder_size(output_folder_path)
+            # everything left behind plus the working files removed on the way
+            publication["bytes_written"] = publication["final_bytes"] + reclaimed_byte_count
+            publication["peak_disk_bytes"] = max(
+                publication["peak_disk_bytes"], publication["final_bytes"]
+            )
+
+    def find_folder_size(self, folder_path: str) -> int:
+        folder_size = 0
+        try:
+            with os.scandir(folder_path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_file():
+                            folder_size += entry.stat().st_size
+                    except OSError:
+                        continue
+        except OSError:
+            return 0
+        return folder_size
+
+    def sample_disk_use(self) -> None:
+        with self.lock:
+            active_output_folder_paths = dict(self.active_output_folder_paths)
+        for publication_folder, output_folder_path in active_output_folder_paths.items():
+            folder_size = self.find_folder_size(output_folder_path)
+            with self.lock:
+                publication = self.publications[publication_folder]
+                publication["peak_disk_bytes"] = max(
+                    publication["peak_disk_bytes"], folder_size
+                )
+
+    def sample_disk_use_until_stopped(self) -> None:
+        while not self.stop_sampling.wait(self.sample_interval):
+            self.sample_disk_use()
+
+    def close(self) -> None:
+        self.stop_sampling.set()
+        self.sampler.join()
+
+    def add_stages(self, stage_totals: dict[str, dict], stages: dict[str, dict]) -> None:
+        for stage_name, stage in stages.items():
+            if stage_name not in stage_totals:
+                stage_totals[stage_name] = dict(stage)
+                continue
+            for measure_name in stage.keys():
+                stage_totals[stage_name][measure_name] += stage[measure_name]
+
+    def find_stage_totals(self) -> dict[str, dict]:
+        stage_totals = dict[str, dict]()
+        self.add_stages(stage_totals, self.run_stages)
+        self.add_stages(stage_totals, self.retired_stage_totals)
+        for stages in self.stages_by_publication.values():
+            self.add_stages(stage_totals, stages)
+        return stage_totals
+
+    def retire_publications(self, kept_count: int) -> None:
+        # only the most recently finished publications are kept in full, the
+        # rest are folded into the stage totals
+        with self.lock:
+            finished_publication_folders = [
+                publication_folder
+                for publication_folder in self.publications.keys()
+                if publication_folder not in self.active_output_folder_paths
+            ]
+            retired_count = max(0, len(finished_publication_folders) - kept_count)
+            for publication_folder in finished_publication_folders[:retired_count]:
+                del self.publications[publication_folder]
+            self.retired_publication_count += retired_count
+            # also catches meta data measured after its publication retired
+            for publication_folder in list(self.stages_by_publication.keys()):
+                if publication_folder not in self.publications:
+                    self.add_stages(
+                        self.retired_stage_totals,
+                        self.stages_by_publication.pop(publication_folder),
+                    )
+
+    def describe(self) -> dict:
+        stage_totals = self.find_stage_totals()
+        subprocess_count = 0
+        for stage in stage_totals.values():
+            subprocess_count += stage["subprocesses"]
+
+        peak_memory_kilobytes = 0
+        if resource is not None:
+            peak_memory_kilobytes = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        publications = dict[str, dict]()
+        for publication_folder, publication in self.publications.items():
+            publications[publication_folder] = dict(publication)
+            publications[publication_folder]["stages"] = self.stages_by_publication.get(
+                publication_folder, dict()
+            )
+        return {
+            "started": self.started_time,
+            "wall_time": time.perf_counter() - self.start_time,
+            "cpu_time": time.process_time() - self.start_cpu_time,
+            "subprocess_cpu_time": self.find_child_cpu_time() - self.start_child_cpu_time,
+            "subprocesses": subprocess_count,
+            "peak_memory_kilobytes": peak_memory_kilobytes,
+            "stages": stage_totals,
+            "publications": publications,
+            "retired_publications": self.retired_publication_count,
+        }
+
+    def save(self, report_file_path: str) -> None:
+        with open(report_file_path, "w") as report_file:
+            json.dump(self.describe(), report_file, indent=2, sort_keys=True)
+
+        if self.profile_path is not None and len(self.profiles) > 0:
+            profile_stats = pstats.Stats(self.profiles[0])
+            for profile in self.profiles[1:]:
+                profile_stats.add(profile)
+            profile_stats.dump_stats(self.profile_path)
+
+    def summarise(self) -> None:
+        report = self.describe()
+        print(
+            "".join(
+                [
+                    "Finished in ",
+                    format(report["wall_time"], ".1f"),
+                    "s (",
+                    format(report["cpu_time"], ".1f"),
+                    "s cpu, ",
+                    format(report["subprocess_cpu_time"], ".1f"),
+                    "s cpu in ",
+                    str(report["subprocesses"]),
+                    " subprocesses)",
+                ]
+            )
+        )
+        stage_totals = report["stages"]
+        for stage_name in sorted(
+            stage_totals.keys(), key=lambda stage_name: -stage_totals[stage_name]["wall_time"]
+        ):
+            stage = stage_totals[stage_name]
+            print(
+                "".join(
+                    [
+                        "  ",
+                        stage_name.ljust(16),
+                        format(stage["wall_time"], ".2f").rjust(10),
+                        "s wall ",
+                        format(stage["cpu_time"], ".2f").rjust(9),
+                        "s cpu ",
+                        str(stage["subprocesses"]).rjust(7),
+                        " subprocesses ",
+                        str(stage["calls"]).rjust(7),
+                        " calls",
+                    ]
+                )
+            )
+        for publication_folder in sorted(report["publications"].keys()):
+            publication = report["publications"][publication_folder]
+            print(
+                "".join(
+                    [
+                        "  ",
+                        publication_folder,
+                        ": ",
+                        format(publication["wall_time"], ".1f"),
+                        "s, ",
+                        format(publication["bytes_written"] / (1024 * 1024), ".1f"),
+                        " MB written, ",
+                        format(publication["peak_disk_bytes"] / (1024 * 1024), ".1f"),
+                        " MB peak disk use",
+                    ]
+                )
+            )
+
+
+class BuildManifest:
+    file_name = "build.json"
+
+    def __init__(self, output_folder_path: str) -> None:
+        self.file_path = os.path.join(output_folder_path, BuildManifest.file_name)
+        self.output_folder_path = output_folder_path
+        self.pdf_size = -1
+        self.pdf_modified_time = -1
+        self.pdf_hash = ""
+        self.options_signature = dict()
+        self.artefacts_by_page_stem_name = dict[str, list[str]]()
+        self.images_by_page_stem_name = dict[str, list[dict]]()
+        self.isbns = list[str]()
+        self.completed_stages = list[str]()
+        # the finalising options the output was last finalised with
+        self.finalised = dict()
+        self.lock = threading.Lock()
+        self.last_save_time = 0.0
+
+    @staticmethod
+    def exists(output_folder_path: str) -> bool:
+        file_path = os.path.join(output_folder_path, BuildManifest.file_name)
+        return os.path.exists(file_path)
+
+    @staticmethod
+    def signature_of(options: Options) -> dict:
+        # only the options that change what ends up in the output folder
+        return {
+            "extract_text": options.extract_text,
+            "generate_jpgs": options.generate_jpgs,
+            "page_resolution": options.page_resolution,
+            "image_resolution": options.image_resolution,
+            "adaptive_ocr": options.adaptive_ocr,
+            "ocr_preprocess": options.ocr_preprocess,
+            "ocr_language": options.ocr_language,
+            "use_text_layer": options.use_text_layer,
+            "text_layer_threshold": options.text_layer_threshold,
+            "text_layer_resolution": options.text_layer_resolution,
+            "image_tier_widths": options.image_tier_widths,
+            "image_formats": options.image_formats,
+        }
+
+    def load(self) -> None:
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, "r") as manifest_file:
+            try:
+                manifest = json.load(manifest_file)
+            except ValueError:
+                return
+        self.pdf_size = manifest.get("pdf_size", -1)
+        self.pdf_modified_time = manifest.get("pdf_modified_time", -1)
+        self.pdf_hash = manifest.get("pdf_hash", "")
+        self.options_signature = manifest.get("options", dict())
+        self.artefacts_by_page_stem_name = manifest.get("pages", dict())
+        self.images_by_page_stem_name = manifest.get("images", dict())
+        self.isbns = manifest.get("isbns", list())
+        self.completed_stages = manifest.get("stages", list())
+        self.finalised = manifest.get("finalised", dict())
+
+    def save(self) -> None:
+        manifest = {
+            "pdf_size": self.pdf_size,
+            "pdf_modified_time": self.pdf_modified_time,
+            "pdf_hash": self.pdf_hash,
+            "options": self.options_signature,
+            "pages": self.artefacts_by_page_stem_name,
+            "images": self.images_by_page_stem_name,
+            "isbns": self.isbns,
+            "stages": self.completed_stages,
+            "finalised": self.finalised,
+        }
+        temporary_file_path = "".join([self.file_path, ".tmp"])
+        with open(temporary_file_path, "w") as manifest_file:
+            json.dump(manifest, manifest_file, indent=2, sort_keys=True)
+        os.replace(temporary_file_path, self.file_path)
+        self.last_save_time = time.monotonic()
+
+    def refresh(self, options: Options, pdf_file_path: str) -> None:
+        # hashing a large pdf is slow, so it is only redone once its size or
+        # modification time has moved on from the recorded build
+        pdf_stat = os.stat(pdf_file_path)
+        pdf_hash = self.pdf_hash
+        if (
+            pdf_stat.st_size != self.pdf_size
+            or pdf_stat.st_mtime_ns != self.pdf_modified_time
+        ):
+            pdf_hash = self.hash_file(pdf_file_path)
+
+        options_signature = BuildManifest.signature_of(options)
+        if pdf_hash != self.pdf_hash or options_signature != self.options_signature:
+            if len(self.pdf_hash) > 0:
+                print("".join(["Rebuilding stale output in ", self.output_folder_path]))
+                self.remove_page_artefacts()
+            # a different PDF is a different book, so whatever meta data was
+            # found for the old one no longer applies
+            if len(self.pdf_hash) > 0 and pdf_hash != self.pdf_hash:
+                self.remove_meta()
+            self.artefacts_by_page_stem_name = dict[str, list[str]]()
+            self.images_by_page_stem_name = dict[str, list[dict]]()
+            self.isbns = list[str]()
+            self.completed_stages = list[str]()
+            self.finalised = dict()
+
+        self.pdf_size = pdf_stat.st_size
+        self.pdf_modified_time = pdf_stat.st_mtime_ns
+        self.pdf_hash = pdf_hash
+        self.options_signature = options_signature
+        self.save()
+
+    def hash_file(self, file_path: str) -> str:
+        file_hash = hashlib.sha256()
+        with open(file_path, "rb") as hashed_file:
+            while True:
+                block = hashed_file.read(1024 * 1024)
+                if len(block) == 0:
+                    break
+                file_hash.update(block)
+        return file_hash.hexdigest()
+
+    def remove_page_artefacts(self) -> None:
+        page_artefact_pattern = re.compile(
+            r"^page(\d{4}|-\d+)\..*(jpg|webp|avif|txt|png)$"
+        )
+        for file_name in os.listdir(self.output_folder_path):
+            if page_artefact_pattern.match(file_name):
+                os.remove(os.path.join(self.output_folder_path, file_name))
+
+    def remove_meta(self) -> None:
+        meta_file_path = os.path.join(self.output_folder_path, "meta.json")
+        for extension in [""] + OutputFinaliser.compressed_extensions:
+            try:
+                os.remove("".join([meta_file_path, extension]))
+            except FileNotFoundError:
+                pass
+
+    def is_page_complete(self, page_stem_name: str, inventory) -> bool:
+        with self.lock:
+            artefacts = self.artefacts_by_page_stem_name.get(page_stem_name)
+        if artefacts is None:
+            return False
+        # the page text is only kept until the search index has been built
+        for artefact in artefacts:
+            if artefact == "txt" and self.is_stage_complete("pdf_search"):
+                continue
+            artefact_file_name = "".join([page_stem_name, ".", artefact])
+            if not inventory.contains(artefact_file_name):
+                return False
+        return True
+
+    def complete_page(
+        self, page_stem_name: str, artefacts: list[str], page_images: list[dict]
+    ) -> None:
+        with self.lock:
+            self.artefacts_by_page_stem_name[page_stem_name] = artefacts
+            self.images_by_page_stem_name[page_stem_name] = page_images
+            if time.monotonic() - self.last_save_time > 5.0:
+                self.save()
+
+    def is_stage_complete(self, stage_name: str) -> bool:
+        return stage_name in self.completed_stages
+
+    def complete_stage(self, stage_name: str) -> None:
+        with self.lock:
+            if stage_name not in self.completed_stages:
+                self.completed_stages.append(stage_name)
+            self.save()
+
+
+class OcrEngine(abc.ABC):
+    @abc.abstractmethod
+    def extract_txt_file(
+        self, input_png_path: str, output_txt_path: str, resolution: int = None
+    ) -> None:
         pass
 
-    def extract(
-        self, options: Options, pdf_file_path: str, output_folder_path: str
+    @abc.abstractmethod
+    def extract_txt_from_image(
+        self, input_image, output_txt_path: str, resolution: int = None
     ) -> None:
-        if options.generate_pngs:
-            self.generate_png_files(pdf_file_path, output_folder_path)
-            
-        png_stem_names = self.find_png_stem_names(output_folder_path)
+        pass
 
-        page_png_stem_names = list[str]()
-        for png_stem_index in range(len(png_stem_names)):
-            page_png_stem_name = "".join(["page", str(png_stem_index).zfill(4)])
-            page_png_stem_names.append(page_png_stem_name)
+    @abc.abstractmethod
+    def describe(self) -> str:
+        pass
 
-            human_page_name = "".join(["page ", str(png_stem_index + 1)])
+    def close(self) -> None:
+        pass
 
-            
-            if options.extract_text:
-                print("".join(["Extracting text from ", human_page_name]))
 
-                png_stem_name = png_stem_names[png_stem_index]
-                png_file_name = "".join([png_stem_name, ".png"])
+class CommandOcrEngine(OcrEngine):
+    def __init__(self, language: str) -> None:
+        self.language = language
 
-                input_png_path = os.path.join(output_folder_path, png_file_name)
-                output_txt_path = os.path.join(output_folder_path, page_png_stem_name)
+    def describe(self) -> str:
+        version_command = ["tesseract", "--version"]
+        runner = Runner()
+        version_result = runner.execute(version_command)
+        # older releases print their version to stderr
+        version_text = version_result.output_text + version_result.error_text
+        version_lines = version_text.strip().splitlines()
+        version = "tesseract"
+        if len(version_lines) > 0:
+            version = version_lines[0]
+        return " ".join([version, self.language])
+
+    def extract_txt_file(
+        self, input_png_path: str, output_txt_path: str, resolution: int = None
+    ) -> None:
+        to_txt_command = [
+            "tesseract",
+            input_png_path,
+            output_txt_path,
+            "-l",
+            self.language,
+        ]
+        if resolution is not None:
+            to_txt_command.extend(["--dpi", str(resolution)])
+        runner = Runner()
+        to_txt_result = runner.execute(to_txt_command)
+        if len(
+            to_txt_result.error_text
+        ) > 0 and not to_txt_result.error_text.startswith("Detected"):
+            raise ToolError(to_txt_command, to_txt_result.error_text)
 
-                self.generate_bordered_png_file(output_folder_path, page_png_stem_name, input_png_path)
+    def extract_txt_from_image(
+        self, input_image, output_txt_path: str, resolution: int = None
+    ) -> None:
+        # tesseract reads the image from stdin, so no bordered file is written
+        if input_image.mode not in ("1", "L", "RGB"):
+            input_image = input_image.convert("RGB")
+        input_image_buffer = io.BytesIO()
+        input_image.save(input_image_buffer, "PPM")
+
+        # a ppm carries no resolution of its own for tesseract to go on
+        to_txt_command = ["tesseract", "stdin", output_txt_path, "-l", self.language]
+        if resolution is not None:
+            to_txt_command.extend(["--dpi", str(resolution)])
+        runner = Runner()
+        to_txt_result = runner.execute(to_txt_command, input_image_buffer.getvalue())
+        if len(
+            to_txt_result.error_text
+        ) > 0 and not to_txt_result.error_text.startswith("Detected"):
+            raise ToolError(to_txt_command, to_txt_result.error_text)
+
+
+class TesserocrOcrEngine(OcrEngine):
+    def __init__(self, language: str) -> None:
+        self.language = language
+        # every worker thread keeps its own engine so the language model is
+        # loaded once per worker rather than once per page
+        self.worker_state = threading.local()
+        self.apis = list()
+        self.apis_lock = threading.Lock()
+
+    def describe(self) -> str:
+        version = tesserocr.tesseract_version().strip().splitlines()[0]
+        return " ".join([version, self.language])
+
+    def find_api(self):
+        api = getattr(self.worker_state, "api", None)
+        if api is None:
+            api = tesserocr.PyTessBaseAPI(lang=self.language)
+            self.worker_state.api = api
+            with self.apis_lock:
+                self.apis.append(api)
+        return api
+
+    def extract_txt_file(
+        self, input_png_path: str, output_txt_path: str, resolution: int = None
+    ) -> None:
+        api = self.find_api()
+        api.SetImageFile(input_png_path)
+        if resolution is not None:
+            api.SetSourceResolution(resolution)
+        self.write_txt_file(api.GetUTF8Text(), output_txt_path)
+
+    def extract_txt_from_image(
+        self, input_image, output_txt_path: str, resolution: int = None
+    ) -> None:
+        api = self.find_api()
+        api.SetImage(input_image)
+        if resolution is not None:
+            api.SetSourceResolution(resolution)
+        self.write_txt_file(api.GetUTF8Text(), output_txt_path)
+
+    def write_txt_file(self, txt_contents: str, output_txt_path: str) -> None:
+        # same naming as the tesseract command, which appends .txt itself
+        with open("".join([output_txt_path, ".txt"]), "w") as txt_file:
+            txt_file.write(txt_contents)
+
+    def close(self) -> None:
+        with self.apis_lock:
+            for api in self.apis:
+                api.End()
+            self.apis.clear()
+
+
+class OcrCache:
+    def __init__(self, options: Options, engine_description: str) -> None:
+        self.cache_folder_path = options.ocr_cache_path
+        self.size_limit = options.ocr_cache_size_limit
+        self.engine_description = engine_description
+        self.lock = threading.Lock()
+        self.hit_count = 0
+        self.miss_count = 0
+        # least recently used entries first
+        self.size_by_key = collections.OrderedDict()
+        self.total_size = 0
+        self.load()
+
+    def load(self) -> None:
+        os.makedirs(self.cache_folder_path, exist_ok=True)
+        entries = list()
+        for prefix_entry in os.scandir(self.cache_folder_path):
+            if not prefix_entry.is_dir():
+                continue
+            for entry in os.scandir(prefix_entry.path):
+                if not entry.name.endswith(".txt"):
+                    continue
+                entry_stat = entry.stat()
+                entries.append([entry_stat.st_mtime, Path(entry.name).stem, entry_stat.st_size])
+        entries.sort()
+        for _, key, size in entries:
+            self.size_by_key[key] = size
+            self.total_size += size
+
+    def key_for(self, page_png_path: str) -> str:
+        # the rendered page plus the engine version and language, so an
+        # upgraded tesseract never serves stale results
+        key_hash = hashlib.sha256()
+        key_hash.update(self.engine_description.encode("utf-8"))
+        key_hash.update(b"\n")
+        with open(page_png_path, "rb") as page_png_file:
+            while True:
+                block = page_png_file.read(1024 * 1024)
+                if len(block) == 0:
+                    break
+                key_hash.update(block)
+        return key_hash.hexdigest()
+
+    def entry_path(self, key: str) -> str:
+        entry_file_name = "".join([key, ".txt"])
+        return os.path.join(self.cache_folder_path, key[:2], entry_file_name)
+
+    def find(self, key: str) -> str:
+        with self.lock:
+            if key not in self.size_by_key:
+                self.miss_count += 1
+                return None
+            self.size_by_key.move_to_end(key)
+            self.hit_count += 1
+        entry_path = self.entry_path(key)
+        try:
+            with open(entry_path, "r") as entry_file:
+                txt_contents = entry_file.read()
+            os.utime(entry_path)
+        except OSError:
+            with self.lock:
+                self.forget(key)
+                self.hit_count -= 1
+                self.miss_count += 1
+            return None
+        return txt_contents
+
+    def store(self, key: str, txt_contents: str) -> None:
+        entry_path = self.entry_path(key)
+        os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+        temporary_entry_path = "".join([entry_path, ".", str(threading.get_ident())])
+        with open(temporary_entry_path, "w") as entry_file:
+            entry_file.write(txt_contents)
+        os.replace(temporary_entry_path, entry_path)
+        size = os.path.getsize(entry_path)
+
+        with self.lock:
+            self.forget(key)
+            self.size_by_key[key] = size
+            self.total_size += size
+            while self.total_size > self.size_limit and len(self.size_by_key) > 1:
+                evicted_key = next(iter(self.size_by_key))
+                self.forget(evicted_key)
+                try:
+                    os.remove(self.entry_path(evicted_key))
+                except OSError:
+                    pass
+
+    def forget(self, key: str) -> None:
+        size = self.size_by_key.pop(key, None)
+        if size is not None:
+            self.total_size -= size
+
+    def report(self) -> None:
+        print(
+            "".join(
+                [
+                    "OCR cache: ",
+                    str(self.hit_count),
+                    " hits, ",
+                    str(self.miss_count),
+                    " misses",
+                ]
+            )
+        )
 
-                bordered_png_file_name = "".join([page_png_stem_name, ".bordered.png"])
-                bordered_png_path = os.path.join(output_folder_path, bordered_png_file_name)
 
-                self.extract_txt_file(bordered_png_path, output_txt_path)
+class IsbnLookup:
+    def __init__(self, options: Options) -> None:
+        self.lookup_url = options.isbn_lookup_url
+        self.timeout = options.isbn_lookup_timeout
+        self.retry_count = options.isbn_lookup_retry_count
+        self.negative_cache_age = options.isbn_negative_cache_age
+        self.cache_file_path = None
+        if options.use_isbn_cache:
+            self.cache_file_path = options.isbn_cache_path
+        # bounded so a library full of books doesn't hammer the api
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=options.isbn_lookup_limit
+        )
+        self.lock = threading.Lock()
+        self.entries_by_isbn = dict[str, dict]()
+        self.futures_by_isbn = dict[str, concurrent.futures.Future]()
+        self.is_dirty = False
+        self.hit_count = 0
+        self.request_count = 0
+        self.load()
+
+    def load(self) -> None:
+        if self.cache_file_path is None or not os.path.exists(self.cache_file_path):
+            return
+        with open(self.cache_file_path, "r") as cache_file:
+            try:
+                self.entries_by_isbn = json.load(cache_file)
+            except ValueError:
+                return
+
+    def save(self) -> None:
+        with self.lock:
+            if self.cache_file_path is None or not self.is_dirty:
+                return
+            os.makedirs(os.path.dirname(self.cache_file_path), exist_ok=True)
+            temporary_file_path = "".join([self.cache_file_path, ".tmp"])
+            with open(temporary_file_path, "w") as cache_file:
+                json.dump(self.entries_by_isbn, cache_file, indent=2, sort_keys=True)
+            os.replace(temporary_file_path, self.cache_file_path)
+            self.is_dirty = False
+
+    def submit(self, potential_isbn: str) -> concurrent.futures.Future:
+        # the same isbn turning up in several books at once is only looked up
+        # once
+        with self.lock:
+            lookup_future = self.futures_by_isbn.get(potential_isbn)
+            if lookup_future is None:
+                lookup_future = self.executor.submit(self.lookup, potential_isbn)
+                self.futures_by_isbn[potential_isbn] = lookup_future
+            return lookup_future
+
+    def lookup(self, potential_isbn: str) -> Meta:
+        try:
+            meta = self.query(potential_isbn)
+            if meta is None and len(potential_isbn) > 10:
+                meta = self.query(potential_isbn[:10])
+            return meta
+        finally:
+            # forgotten before the future completes, so only lookups in
+            # flight are kept. after that a found or missing book is answered
+            # from entries_by_isbn, and a failed one is tried again
+            with self.lock:
+                self.futures_by_isbn.pop(potential_isbn, None)
+
+    def query(self, isbn: str) -> Meta:
+        with self.lock:
+            entry = self.entries_by_isbn.get(isbn)
+            if entry is not None:
+                entry_age = time.time() - entry["time"]
+                if entry["meta"] is not None or entry_age < self.negative_cache_age:
+                    self.hit_count += 1
+                    return self.meta_from_entry(isbn, entry)
+
+        # a failed request raises rather than being cached, as it says
+        # nothing about the book
+        lookup_response = self.fetch(isbn)
+        entry = {"time": time.time(), "meta": None}
+        if lookup_response.get("totalItems", 0) > 0:
+            volume_info = lookup_response["items"][0]["volumeInfo"]
+            entry["meta"] = {
+                "authors": volume_info.get("authors", list()),
+                "title": volume_info.get("title", ""),
+                "thumbnail_url": volume_info.get("imageLinks", dict()).get("thumbnail", ""),
+            }
+        with self.lock:
+            self.entries_by_isbn[isbn] = entry
+            self.is_dirty = True
+        return self.meta_from_entry(isbn, entry)
+
+    def meta_from_entry(self, isbn: str, entry: dict) -> Meta:
+        if entry["meta"] is None:
+            return None
+        meta = Meta()
+        meta.isbn = isbn
+        meta.authors = entry["meta"]["authors"]
+        meta.title = entry["meta"]["title"]
+        meta.thumbnail_url = entry["meta"]["thumbnail_url"]
+        return meta
+
+    def fetch(self, isbn: str) -> dict:
+        url = "".join([self.lookup_url, isbn])
+        lookup_error = None
+        for attempt_index in range(self.retry_count + 1):
+            if attempt_index > 0:
+                time.sleep(0.5 * (2 ** attempt_index))
+            with self.lock:
+                self.request_count += 1
+            try:
+                with urllib.request.urlopen(url, timeout=self.timeout) as lookup_response:
+                    lookup_response_data = lookup_response.read()
+                return json.loads(lookup_response_data.decode("utf-8"))
+            except urllib.error.HTTPError as error:
+                lookup_error = error
+                # only rate limiting and server trouble are worth another go
+                if error.code != 429 and error.code < 500:
+                    break
+            except (OSError, ValueError) as error:
+                lookup_error = error
+        print("".join(["Couldn't look up ISBN ", isbn, ": ", str(lookup_error)]))
+        raise lookup_error
+
+    def shutdown(self) -> None:
+        self.executor.shutdown()
+        self.save()
+
+    def report(self) -> None:
+        print(
+            "".join(
+                [
+                    "ISBN cache: ",
+                    str(self.hit_count),
+                    " hits, ",
+                    str(self.request_count),
+                    " requests",
+                ]
+            )
+        )
 
-            if options.generate_jpgs:
-                print("".join(["Optimising image from ", human_page_name]))
-                self.generate_jpg_file(
-                    output_folder_path, page_png_stem_name, input_png_path
+
+class OutputFinaliser:
+    # the precompressed copies nginx's gzip_static and brotli_static look for
+    compressed_extensions = [".gz", ".br"]
+    hashed_image_pattern = re.compile(
+        r"^(page(?:\d{4}|-\d+)(?:\.[a-z]+)?)\.[0-9a-f]{12}(\.(?:jpg|webp|avif))$"
+    )
+    hash_length = 12
+
+    def __init__(self, options: Options) -> None:
+        self.minify_output = options.minify_output
+        self.compress_output = options.compress_output
+        self.hash_asset_names = options.hash_asset_names
+
+    def signature(self) -> dict:
+        return {
+            "minify": self.minify_output,
+            "compress": self.compress_output,
+            "brotli": self.compress_output and brotli is not None,
+            "hash_asset_names": self.hash_asset_names,
+        }
+
+    def finalise_file(self, file_path: str, minify: bool = False) -> None:
+        # called every time a text asset is written, so a compressed copy is
+        # never left behind describing an older version of the file
+        if minify and self.minify_output:
+            self.minify_json_file(file_path)
+        if self.compress_output:
+            self.compress_file(file_path)
+        else:
+            self.remove_compressed_files(file_path)
+
+    def write_file(self, file_path: str, file_contents: bytes) -> None:
+        temporary_file_path = "".join([file_path, ".tmp"])
+        with open(temporary_file_path, "wb") as written_file:
+            written_file.write(file_contents)
+        os.replace(temporary_file_path, file_path)
+
+    def minify_json_file(self, file_path: str) -> None:
+        with open(file_path, "r") as json_file:
+            json_text = json_file.read()
+        try:
+            contents = json.loads(json_text)
+        except ValueError:
+            # left as it is rather than losing whatever was in it
+            print("".join(["Unable to minify ", file_path]))
+            return
+        minified_text = json.dumps(contents, separators=(",", ":"))
+        if minified_text != json_text:
+            self.write_file(file_path, minified_text.encode("utf-8"))
+
+    def compress_file(self, file_path: str) -> None:
+        with open(file_path, "rb") as source_file:
+            contents = source_file.read()
+        compressed_contents_by_extension = {
+            ".gz": gzip.compress(contents, compresslevel=9, mtime=0)
+        }
+        if brotli is not None:
+            compressed_contents_by_extension[".br"] = brotli.compress(contents, quality=11)
+        for extension in OutputFinaliser.compressed_extensions:
+            compressed_file_path = "".join([file_path, extension])
+            compressed_contents = compressed_contents_by_extension.get(extension)
+            # a tiny file can come out bigger, and then isn't worth serving
+            if compressed_contents is None or len(compressed_contents) >= len(contents):
+                self.remove_file(compressed_file_path)
+                continue
+            self.write_file(compressed_file_path, compressed_contents)
+
+    def remove_compressed_files(self, file_path: str) -> None:
+        for extension in OutputFinaliser.compressed_extensions:
+            self.remove_file("".join([file_path, extension]))
+
+    def remove_file(self, file_path: str) -> None:
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+
+    def hash_file(self, file_path: str) -> str:
+        file_hash = hashlib.sha256()
+        with open(file_path, "rb") as hashed_file:
+            while True:
+                block = hashed_file.read(1024 * 1024)
+                if len(block) == 0:
+                    break
+                file_hash.update(block)
+        return file_hash.hexdigest()[: OutputFinaliser.hash_length]
+
+    def find_stable_name(self, file_name: str) -> str:
+        hashed_image_match = OutputFinaliser.hashed_image_pattern.match(file_name)
+        if hashed_image_match is None:
+            return file_name
+        return "".join([hashed_image_match.group(1), hashed_image_match.group(2)])
+
+    def link_hashed_file(self, output_folder_path: str, stable_name: str) -> str:
+        stable_file_path = os.path.join(output_folder_path, stable_name)
+        if not os.path.exists(stable_file_path):
+            return stable_name
+        stem_name, extension = os.path.splitext(stable_name)
+        hashed_name = "".join([stem_name, ".", self.hash_file(stable_file_path), extension])
+        hashed_file_path = os.path.join(output_folder_path, hashed_name)
+        if not os.path.exists(hashed_file_path):
+            # a hard link costs no space and leaves the stable name in place
+            # for the build manifest to keep checking
+            try:
+                os.link(stable_file_path, hashed_file_path)
+            except OSError:
+                shutil.copyfile(stable_file_path, hashed_file_path)
+        return hashed_name
+
+    def name_page_images(self, output_folder_path: str, structure_file_path: str) -> None:
+        # rewrites every image name in the structure to its hashed form, or
+        # back to its stable one, and removes hashed names no longer used
+        with open(structure_file_path, "r") as structure_file:
+            structure = json.load(structure_file)
+        file_name_by_stable_name = dict[str, str]()
+
+        def rename(file_name: str) -> str:
+            stable_name = self.find_stable_name(file_name)
+            if not self.hash_asset_names:
+                return stable_name
+            if stable_name not in file_name_by_stable_name:
+                file_name_by_stable_name[stable_name] = self.link_hashed_file(
+                    output_folder_path, stable_name
                 )
+            return file_name_by_stable_name[stable_name]
+
+        for page in structure.get("pages", list()):
+            page["file"] = rename(page["file"])
+            if "thumbnail" in page:
+                page["thumbnail"] = rename(page["thumbnail"])
+            for page_image in page.get("images", list()):
+                page_image["file"] = rename(page_image["file"])
+
+        used_file_names = set[str](file_name_by_stable_name.values())
+        for file_name in os.listdir(output_folder_path):
+            if OutputFinaliser.hashed_image_pattern.match(file_name) is None:
+                continue
+            if file_name not in used_file_names:
+                self.remove_file(os.path.join(output_folder_path, file_name))
 
-        if options.cleanup_pngs:
-            for png_stem_index in range(len(png_stem_names)):
-                human_page_name = "".join(["page ", str(png_stem_index + 1)])
-                print("".join(["Cleaning up image for ", human_page_name]))
-                png_stem_name = png_stem_names[png_stem_index]
-                self.cleanup_png_by_stem(output_folder_path, png_stem_name)
+        if self.minify_output:
+            structure_text = json.dumps(structure, separators=(",", ":"))
+        else:
+            structure_text = json.dumps(structure, indent=2)
+        self.write_file(structure_file_path, structure_text.encode("utf-8"))
+
+
+def find_publication_folders(output_root_path: str) -> set[str]:
+    # one level of the output root is enough to notice publications that
+    # have been added or removed since the library files were last written
+    directory_names = set[str]()
+    if os.path.isdir(output_root_path):
+        with os.scandir(output_root_path) as entries:
+            for entry in entries:
+                if not entry.is_dir() or entry.name.startswith("."):
+                    continue
+                if entry.name in (LibrarySearchIndex.folder_name, LibraryCatalogue.folder_name):
+                    continue
+                directory_names.add(entry.name)
+    return directory_names
+
+
+class LibrarySearchIndex:
+    folder_name = "search"
+    publications_file_name = "publications.json"
+
+    def __init__(self, output_root_path: str, finaliser: OutputFinaliser = None) -> None:
+        self.output_root_path = output_root_path
+        self.folder_path = os.path.join(output_root_path, LibrarySearchIndex.folder_name)
+        self.finaliser = finaliser
+        self.lock = threading.Lock()
+        self.next_publication_id = 0
+        self.publication_by_folder = dict[str, dict]()
+        self.postings_by_word_by_shard_name = dict[str, dict[str, list[int]]]()
+        self.dirty_shard_names = set[str]()
+        self.pending_manifests = list[BuildManifest]()
+        self.is_dirty = False
+        self.load()
+
+    def load(self) -> None:
+        publications_file_path = os.path.join(
+            self.folder_path, LibrarySearchIndex.publications_file_name
+        )
+        if not os.path.exists(publications_file_path):
+            return
+        with open(publications_file_path, "r") as publications_file:
+            publications = json.load(publications_file)
+        self.next_publication_id = publications["next_id"]
+        for publication in publications["publications"]:
+            self.publication_by_folder[publication["folder"]] = publication
+
+        # publications whose folders have gone are taken out, so searches
+        # never lead to a book that isn't there any more
+        directory_names = find_publication_folders(self.output_root_path)
+        for publication_folder in list(self.publication_by_folder.keys()):
+            if publication_folder not in directory_names:
+                self.remove_publication(publication_folder)
+
+    def remove_publication(self, publication_folder: str) -> None:
+        publication = self.publication_by_folder.pop(publication_folder)
+        for shard_name in publication["shards"]:
+            self.remove_postings(shard_name, publication["id"])
+        self.is_dirty = True
+
+    @staticmethod
+    def shard_name_for(word: str) -> str:
+        # words are sharded by their first two characters, with anything
+        # that isn't a letter or digit spelled out so it is file name safe
+        shard_name_characters = list[str]()
+        for character in word[:2]:
+            if character in "abcdefghijklmnopqrstuvwxyz0123456789":
+                shard_name_characters.append(character)
+            else:
+                shard_name_characters.append("".join(["_", format(ord(character), "x")]))
+        return "".join(shard_name_characters)
+
+    def find_shard(self, shard_name: str) -> dict[str, list[int]]:
+        if shard_name in self.postings_by_word_by_shard_name:
+            return self.postings_by_word_by_shard_name[shard_name]
+        postings_by_word = dict[str, list[int]]()
+        shard_file_path = os.path.join(self.folder_path, "".join([shard_name, ".json"]))
+        if os.path.exists(shard_file_path):
+            with open(shard_file_path, "r") as shard_file:
+                postings_by_word = json.load(shard_file)
+        self.postings_by_word_by_shard_name[shard_name] = postings_by_word
+        return postings_by_word
+
+    def remove_postings(self, shard_name: str, publication_id: int) -> None:
+        postings_by_word = self.find_shard(shard_name)
+        for word in list(postings_by_word.keys()):
+            postings = postings_by_word[word]
+            kept_postings = list[int]()
+            for posting_index in range(0, len(postings), 2):
+                if postings[posting_index] != publication_id:
+                    kept_postings.append(postings[posting_index])
+                    kept_postings.append(postings[posting_index + 1])
+            if len(kept_postings) == 0:
+                del postings_by_word[word]
+            else:
+                postings_by_word[word] = kept_postings
+        self.dirty_shard_names.add(shard_name)
+
+    def add_publication(
+        self, publication_folder: str, output_folder_path: str, manifest: BuildManifest
+    ) -> None:
+        # the totals come from the publication's own search.json, so adding
+        # a book never needs any other book's text
+        search_file_path = os.path.join(output_folder_path, "search.json")
+        if not os.path.exists(search_file_path):
+            return
+        with open(search_file_path, "r") as search_file:
+            search = json.load(search_file)
+        count_by_word = dict[str, int]()
+        for word, postings in search["terms"].items():
+            count_by_word[word] = sum(postings[1::2])
+
+        with self.lock:
+            publication = self.publication_by_folder.get(publication_folder)
+            if publication is None:
+                publication = {
+                    "id": self.next_publication_id,
+                    "folder": publication_folder,
+                    "shards": list[str](),
+                }
+                self.next_publication_id += 1
+                self.publication_by_folder[publication_folder] = publication
+
+            for shard_name in publication["shards"]:
+                self.remove_postings(shard_name, publication["id"])
+
+            shard_names = set[str]()
+            for word in count_by_word.keys():
+                shard_name = LibrarySearchIndex.shard_name_for(word)
+                shard_names.add(shard_name)
+                postings_by_word = self.find_shard(shard_name)
+                if word not in postings_by_word:
+                    postings_by_word[word] = list[int]()
+                postings_by_word[word].append(publication["id"])
+                postings_by_word[word].append(count_by_word[word])
+                self.dirty_shard_names.add(shard_name)
+            publication["shards"] = sorted(shard_names)
+            self.pending_manifests.append(manifest)
+
+    def flush(self) -> None:
+        with self.lock:
+            if (
+                not self.is_dirty
+                and len(self.pending_manifests) == 0
+                and len(self.dirty_shard_names) == 0
+            ):
+                return
+            os.makedirs(self.folder_path, exist_ok=True)
+            for shard_name in sorted(self.dirty_shard_names):
+                shard_file_name = "".join([shard_name, ".json"])
+                shard_file_path = os.path.join(self.folder_path, shard_file_name)
+                postings_by_word = self.postings_by_word_by_shard_name[shard_name]
+                if len(postings_by_word) == 0:
+                    if os.path.exists(shard_file_path):
+                        os.remove(shard_file_path)
+                    if self.finaliser is not None:
+                        self.finaliser.remove_compressed_files(shard_file_path)
+                    continue
+                self.write_json_file(shard_file_path, postings_by_word)
+            self.dirty_shard_names.clear()
+
+            publications = {
+                "next_id": self.next_publication_id,
+                "publications": sorted(
+                    self.publication_by_folder.values(),
+                    key=lambda publication: publication["id"],
+                ),
+            }
+            publications_file_path = os.path.join(
+                self.folder_path, LibrarySearchIndex.publications_file_name
+            )
+            self.write_json_file(publications_file_path, publications)
+            self.is_dirty = False
+
+            # only now is each publication safely part of the library index
+            for manifest in self.pending_manifests:
+                manifest.complete_stage("library_search")
+            self.pending_manifests.clear()
+
+    def write_json_file(self, file_path: str, contents) -> None:
+        temporary_file_path = "".join([file_path, ".tmp"])
+        with open(temporary_file_path, "w") as json_file:
+            json.dump(contents, json_file, separators=(",", ":"), sort_keys=True)
+        os.replace(temporary_file_path, file_path)
+        if self.finaliser is not None:
+            self.finaliser.finalise_file(file_path)
+
+
+class LibraryCatalogue:
+    file_name = "structure.json"
+    # the paged catalogue the viewer reads, sorted by title and split into
+    # chunks so a large library can be shown a screenful at a time
+    folder_name = "catalogue"
+    index_file_name = "index.json"
+
+    def __init__(
+        self, output_root_path: str, chunk_size: int = 100, finaliser: OutputFinaliser = None
+    ) -> None:
+        self.output_root_path = output_root_path
+        self.finaliser = finaliser
+        self.file_path = os.path.join(output_root_path, LibraryCatalogue.file_name)
+        self.folder_path = os.path.join(output_root_path, LibraryCatalogue.folder_name)
+        self.index_file_path = os.path.join(self.folder_path, LibraryCatalogue.index_file_name)
+        self.chunk_size = max(1, chunk_size)
+        self.lock = threading.Lock()
+        self.publication_by_folder = dict[str, dict]()
+        self.chunk_text_by_file_name = dict[str, str]()
+        self.is_dirty = False
+        self.load()
+
+    def load(self) -> None:
+        # publications already in the chunks keep their description, so only
+        # new or rebuilt ones have their meta.json and structure.json read
+        index = self.load_json(self.index_file_path, dict())
+        for chunk in index.get("chunks", list()):
+            chunk_file_path = os.path.join(self.folder_path, chunk["file"])
+            try:
+                with open(chunk_file_path, "r") as chunk_file:
+                    chunk_text = chunk_file.read()
+                publications = json.loads(chunk_text)["publications"]
+            except (OSError, ValueError, KeyError):
+                self.is_dirty = True
+                continue
+            self.chunk_text_by_file_name[chunk["file"]] = chunk_text
+            for publication in publications:
+                self.publication_by_folder[publication["folder"]] = publication
+
+        directory_names = find_publication_folders(self.output_root_path)
+        for publication_folder in list(self.publication_by_folder.keys()):
+            if publication_folder not in directory_names:
+                self.remove_publication(publication_folder)
+        for directory_name in sorted(directory_names):
+            if directory_name not in self.publication_by_folder:
+                self.add_publication(directory_name)
+
+    def load_json(self, file_path: str, default_value):
+        try:
+            with open(file_path, "r") as json_file:
+                return json.load(json_file)
+        except (OSError, ValueError):
+            return default_value
+
+    def describe_publication(self, publication_folder: str) -> dict:
+        publication_folder_path = os.path.join(self.output_root_path, publication_folder)
+        publication = {
+            "folder": publication_folder,
+            "title": publication_folder,
+            "authors": list[str](),
+            "cover": "",
+            "pages": 0,
+        }
+
+        structure = self.load_json(
+            os.path.join(publication_folder_path, LibraryCatalogue.file_name), dict()
+        )
+        pages = structure.get("pages", list())
+        if len(pages) > 0:
+            publication["pages"] = len(pages)
+            publication["cover"] = pages[0].get("thumbnail", pages[0]["file"])
+
+        meta = self.load_json(os.path.join(publication_folder_path, "meta.json"), dict())
+        if len(meta.get("title", "")) > 0:
+            publication["title"] = meta["title"]
+        publication["authors"] = meta.get("authors", list[str]())
+        return publication
+
+    def add_publication(self, publication_folder: str) -> None:
+        # also used to refresh a publication that has been rebuilt or has
+        # just had its meta data found
+        publication = self.describe_publication(publication_folder)
+        with self.lock:
+            if self.publication_by_folder.get(publication_folder) == publication:
+                return
+            self.publication_by_folder[publication_folder] = publication
+            self.is_dirty = True
+
+    def remove_publication(self, publication_folder: str) -> None:
+        with self.lock:
+            if publication_folder not in self.publication_by_folder:
+                return
+            del self.publication_by_folder[publication_folder]
+            self.is_dirty = True
+
+    def find_sort_key(self, publication: dict) -> list[str]:
+        return [publication["title"].casefold(), publication["folder"]]
+
+    def write_file(self, file_path: str, file_text: str, minify: bool = False) -> None:
+        temporary_file_path = "".join([file_path, ".tmp"])
+        with open(temporary_file_path, "w") as written_file:
+            written_file.write(file_text)
+        os.replace(temporary_file_path, file_path)
+        if self.finaliser is not None:
+            self.finaliser.finalise_file(file_path, minify)
+
+    def save(self) -> None:
+        with self.lock:
+            if (
+                not self.is_dirty
+                and os.path.exists(self.file_path)
+                and os.path.exists(self.index_file_path)
+            ):
+                return
+            temporary_file_path = "".join([self.file_path, ".tmp"])
+            with open(temporary_file_path, "w") as structure_file:
+                structure_file.write("{\n")
+
+                structure_file.write('  "publications" : [\n')
+                is_first_publication = True
+                for publication_folder in sorted(self.publication_by_folder.keys()):
+                    if is_first_publication:
+                        is_first_publication = False
+                    else:
+                        structure_file.write(",\n")
+                    structure_file.write('    { "folder" : ')
+                    structure_file.write(json.dumps(publication_folder))
+
+                    structure_file.write(" }")
+                structure_file.write("\n  ]\n")
+                structure_file.write("}\n")
+            os.replace(temporary_file_path, self.file_path)
+            if self.finaliser is not None:
+                self.finaliser.finalise_file(self.file_path, minify=True)
+
+            # only chunks whose contents moved are rewritten, so adding a book
+            # late in the alphabet leaves the earlier chunks alone
+            os.makedirs(self.folder_path, exist_ok=True)
+            publications = sorted(self.publication_by_folder.values(), key=self.find_sort_key)
+            chunks = list[dict]()
+            for chunk_start in range(0, len(publications), self.chunk_size):
+                chunk_publications = publications[chunk_start : chunk_start + self.chunk_size]
+                chunk_file_name = "".join(
+                    [str(chunk_start // self.chunk_size).zfill(4), ".json"]
+                )
+                chunk_text = json.dumps(
+                    {"publications": chunk_publications}, separators=(",", ":"), sort_keys=True
+                )
+                if self.chunk_text_by_file_name.get(chunk_file_name) != chunk_text:
+                    self.write_file(os.path.join(self.folder_path, chunk_file_name), chunk_text)
+                    self.chunk_text_by_file_name[chunk_file_name] = chunk_text
+                chunks.append(
+                    {
+                        "file": chunk_file_name,
+                        "count": len(chunk_publications),
+                        "first": self.find_sort_key(chunk_publications[0])[0],
+                        "last": self.find_sort_key(chunk_publications[-1])[0],
+                    }
+                )
+
+            index = {
+                "publication_count": len(publications),
+                "chunk_size": self.chunk_size,
+                "sort": "title",
+                "chunks": chunks,
+            }
+            self.write_file(
+                self.index_file_path, json.dumps(index, indent=2, sort_keys=True), minify=True
+            )
+
+            chunk_file_names = set[str](chunk["file"] for chunk in chunks)
+            for chunk_file_name in list(self.chunk_text_by_file_name.keys()):
+                if chunk_file_name in chunk_file_names:
+                    continue
+                del self.chunk_text_by_file_name[chunk_file_name]
+                chunk_file_path = os.path.join(self.folder_path, chunk_file_name)
+                try:
+                    os.remove(chunk_file_path)
+                except OSError:
+                    pass
+                if self.finaliser is not None:
+                    self.finaliser.remove_compressed_files(chunk_file_path)
+            self.is_dirty = False
+
+
+def create_ocr_engine(options: Options) -> OcrEngine:
+    if options.ocr_backend == "command":
+        return CommandOcrEngine(options.ocr_language)
+    if tesserocr is None:
+        if options.ocr_backend == "tesserocr":
+            print("tesserocr is not installed, falling back to the tesseract command")
+        return CommandOcrEngine(options.ocr_language)
+    return TesserocrOcrEngine(options.ocr_language)
+
+
+class PageInventory:
+    def __init__(self, folder_path: str) -> None:
+        self.folder_path = folder_path
+        self.file_names = set[str]()
+        self.lock = threading.Lock()
+        self.scan()
+
+    def scan(self) -> None:
+        file_names = set[str]()
+        if os.path.isdir(self.folder_path):
+            with os.scandir(self.folder_path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        file_names.add(entry.name)
+        with self.lock:
+            self.file_names = file_names
+
+    def add(self, file_name: str) -> None:
+        with self.lock:
+            self.file_names.add(file_name)
+
+    def discard(self, file_name: str) -> None:
+        with self.lock:
+            self.file_names.discard(file_name)
+
+    def contains(self, file_name: str) -> bool:
+        with self.lock:
+            return file_name in self.file_names
+
+    def find_stem_names(self, extension: str) -> list[str]:
+        with self.lock:
+            file_names = list(self.file_names)
+        stem_names = list[str]()
+        for file_name in file_names:
+            if file_name.endswith(extension):
+                stem_names.append(Path(file_name).stem)
+        stem_names.sort()
+        return stem_names
+
+
+class Tokenizer:
+    # a word is lower cased and stripped down to a-z, 0-9 and . , @ $ which
+    # is the same as filtering each whitespace separated word on its own
+    unsafe_characters_pattern = re.compile(r"[^a-z0-9.,@$\s]+")
+
+    def tokenize(self, text: str) -> list[str]:
+        safe_text = Tokenizer.unsafe_characters_pattern.sub("", text.lower())
+        return safe_text.split()
+
+    def read_lines(self, txt_file_path: str):
+        with open(txt_file_path, "r") as txt_file:
+            for line in txt_file:
+                yield line
+
+    def read_line_blocks(self, txt_file_path: str, block_size: int = 65536):
+        with open(txt_file_path, "r") as txt_file:
+            while True:
+                lines = txt_file.readlines(block_size)
+                if len(lines) == 0:
+                    break
+                yield "".join(lines)
+
+    def count_words_in_file(self, txt_file_path: str) -> collections.Counter:
+        # words never cross a line break, so pages can be streamed in blocks
+        # of whole lines rather than read in one go
+        count_by_word = collections.Counter()
+        for line_block in self.read_line_blocks(txt_file_path):
+            count_by_word.update(self.tokenize(line_block))
+        return count_by_word
+
+
+class Scheduler:
+    def __init__(self, options: Options) -> None:
+        # one pool of page workers is shared by every publication in flight
+        # so the whole run stays within a single cpu budget
+        self.page_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=options.job_count
+        )
+        self.publication_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=options.publication_limit
+        )
+        # each publication may only queue this many pages at a time, which
+        # keeps a large book from pushing a small one to the back of the queue
+        self.page_window_size = options.job_count
+        self.run_report = RunReport(options)
+        self.ocr_engine = create_ocr_engine(options)
+        self.ocr_cache = None
+        if options.use_ocr_cache and options.extract_text:
+            # the preprocessing changes what tesseract sees, so it is part of
+            # every cache key too
+            with self.run_report.measure(None, "setup"):
+                ocr_engine_description = self.ocr_engine.describe()
+            ocr_description = " ".join(
+                [
+                    ocr_engine_description,
+                    "adaptive" if options.adaptive_ocr else "fixed",
+                    options.ocr_preprocess,
+                ]
+            )
+            self.ocr_cache = OcrCache(options, ocr_description)
+        self.finaliser = OutputFinaliser(options)
+        self.library_search = None
+        if options.generate_library_search:
+            self.library_search = LibrarySearchIndex(options.output_root_path, self.finaliser)
+        self.catalogue = None
+        if options.generate_structure:
+            self.catalogue = LibraryCatalogue(
+                options.output_root_path, options.catalogue_chunk_size, self.finaliser
+            )
+        # metadata is written off the page pipeline, so a slow network never
+        # holds up a publication slot
+        self.isbn_lookup = None
+        self.metadata_executor = None
+        self.metadata_futures = list[concurrent.futures.Future]()
+        self.metadata_lock = threading.Lock()
+        if options.generate_meta_from_isbn:
+            self.isbn_lookup = IsbnLookup(options)
+            self.metadata_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=options.publication_limit
+            )
+        # the formats the installed convert can write, found on first use
+        self.convert_image_formats = None
+        self.convert_image_formats_lock = threading.Lock()
+
+    def submit_publication(self, function, *arguments) -> concurrent.futures.Future:
+        return self.publication_executor.submit(function, *arguments)
+
+    def submit_metadata(self, function, *arguments) -> None:
+        metadata_future = self.metadata_executor.submit(function, *arguments)
+        with self.metadata_lock:
+            self.metadata_futures.append(metadata_future)
+
+    def collect_metadata(self) -> None:
+        # lets go of finished metadata work, so a long running watch doesn't
+        # hold on to every future it has ever made
+        with self.metadata_lock:
+            done_futures = [future for future in self.metadata_futures if future.done()]
+            self.metadata_futures = [
+                future for future in self.metadata_futures if not future.done()
+            ]
+        for done_future in done_futures:
+            metadata_exception = done_future.exception()
+            if metadata_exception is not None:
+                print("".join(["Unable to write meta data: ", str(metadata_exception)]))
+
+    def find_convert_image_formats(self) -> set[str]:
+        # asked once per run, so a missing webp or avif delegate leaves that
+        # format out of every page rather than failing each one
+        with self.convert_image_formats_lock:
+            if self.convert_image_formats is not None:
+                return self.convert_image_formats
+            list_command = ["convert", "-list", "format"]
+            runner = Runner()
+            list_result = runner.execute(list_command)
+            image_format_by_convert_format = {"JPEG": "jpg", "WEBP": "webp", "AVIF": "avif"}
+            self.convert_image_formats = set[str]()
+            for line in list_result.output_text.splitlines():
+                # e.g. "     WEBP* rw+   WebP Image Format (libwebp 1.2.4)"
+                fields = line.split()
+                if len(fields) < 2 or len(fields[1]) < 2 or fields[1][1] != "w":
+                    continue
+                image_format = image_format_by_convert_format.get(fields[0].rstrip("*"))
+                if image_format is not None:
+                    self.convert_image_formats.add(image_format)
+            return self.convert_image_formats
+
+    def run_pages(self, function, argument_lists) -> None:
+        pending_futures = set[concurrent.futures.Future]()
+        try:
+            for arguments in argument_lists:
+                if len(pending_futures) >= self.page_window_size:
+                    done_futures, pending_futures = concurrent.futures.wait(
+                        pending_futures, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for done_future in done_futures:
+                        done_future.result()
+                page_future = self.page_executor.submit(function, *arguments)
+                pending_futures.add(page_future)
+
+            done_futures, pending_futures = concurrent.futures.wait(pending_futures)
+            for done_future in done_futures:
+                done_future.result()
+        except BaseException:
+            # the publication's other pages are stopped before its failure is
+            # passed on, so none of them write into the output folder after
+            # it has been reported
+            for pending_future in pending_futures:
+                pending_future.cancel()
+            concurrent.futures.wait(pending_futures)
+            raise
+
+    def shutdown(self) -> None:
+        self.publication_executor.shutdown()
+        self.page_executor.shutdown()
+        self.ocr_engine.close()
+        if self.metadata_executor is not None:
+            self.metadata_executor.shutdown()
+            self.isbn_lookup.shutdown()
+            self.collect_metadata()
+        self.publish_library()
+        self.run_report.close()
+
+    def publish_library(self) -> None:
+        # brings the library search and catalogue up to date with every
+        # publication finished so far. both only rewrite the files that
+        # changed, so this is cheap to call whenever a publication finishes
+        if self.library_search is not None:
+            self.library_search.flush()
+        if self.catalogue is not None:
+            self.catalogue.save()
 
-        if options.generate_pdf_structures:
-            self.generate_pdf_structure(output_folder_path)
 
-        if options.generate_pdf_structures:
-            print("Generating search indicies")
-            self.generate_pdf_search(output_folder_path)
+class Extractor:
+    binarise_table = [0] * 128 + [255] * 128
+
+    def __init__(self, scheduler: Scheduler = None) -> None:
+        self.scheduler = scheduler
+        self.manifest = None
+        self.inventory = None
+        self.tokenizer = Tokenizer()
+        self.reclaimed_byte_count = 0
+        self.reclaimed_byte_count_lock = threading.Lock()
+        self.publication_folder = ""
+
+    def extract(
+        self, options: Options, pdf_file_path: str, output_folder_path: str
+    ) -> None:
+        owns_scheduler = self.scheduler is None
+        if owns_scheduler:
+            self.scheduler = Scheduler(options)
+        self.publication_folder = os.path.basename(os.path.normpath(output_folder_path))
+        run_report = self.scheduler.run_report
+        run_report.begin_publication(self.publication_folder, output_folder_path)
+        try:
+            self.extract_publication(options, pdf_file_path, output_folder_path)
+        finally:
+            run_report.end_publication(self.publication_folder, self.reclaimed_byte_count)
+            if owns_scheduler:
+                self.scheduler.shutdown()
+                self.scheduler = None
+
+    def measure(self, stage_name: str):
+        return self.scheduler.run_report.measure(self.publication_folder, stage_name)
+
+    def extract_publication(
+        self, options: Options, pdf_file_path: str, output_folder_path: str
+    ) -> None:
+        self.manifest = BuildManifest(output_folder_path)
+        self.manifest.load()
+        self.manifest.refresh(options, pdf_file_path)
+        # listed once here, then every stage keeps it up to date as it goes
+        self.inventory = PageInventory(output_folder_path)
+        if self.manifest.is_stage_complete("publication"):
+            print("".join(["Already up to date ", output_folder_path]))
+            # the image names may have changed, and the catalogue shows the cover
+            if self.finalise_publication(output_folder_path) and options.generate_structure:
+                publication_folder = os.path.basename(os.path.normpath(output_folder_path))
+                self.scheduler.catalogue.add_publication(publication_folder)
+            if options.generate_meta_from_isbn:
+                self.submit_meta_from_isbn(options, output_folder_path)
+            self.add_to_library_search(options, output_folder_path)
+            return
+
+        if not self.manifest.is_stage_complete("pdf_search"):
+            try:
+                if options.generate_pngs and options.stream_pages:
+                    self.extract_pages_streamed(
+                        options, pdf_file_path, output_folder_path
+                    )
+                else:
+                    self.extract_pages(options, pdf_file_path, output_folder_path)
+            finally:
+                # keep whatever pages finished so an interrupted run can resume
+                with self.manifest.lock:
+                    self.manifest.save()
+            self.manifest.complete_stage("pages")
+
+            if options.generate_pdf_structures:
+                with self.measure("structure"):
+                    self.generate_pdf_structure(output_folder_path)
+
+            if options.generate_pdf_structures:
+                print("Generating search indicies")
+                with self.measure("search"):
+                    self.generate_pdf_search(output_folder_path)
+            self.manifest.complete_stage("pdf_search")
+
+        self.finalise_publication(output_folder_path)
 
         if options.generate_structure:
-            self.generate_structure(options)
+            publication_folder = os.path.basename(os.path.normpath(output_folder_path))
+            self.scheduler.catalogue.add_publication(publication_folder)
 
         if options.generate_meta_from_isbn:
             print("Researching ISBN related data")
-            self.generate_meta_from_isbn(options, output_folder_path)
+            # found now, while the page text is still around to search
+            with self.measure("meta"):
+                potential_isbns = self.find_isbns(output_folder_path)
+            with self.manifest.lock:
+                self.manifest.isbns = potential_isbns
+            self.submit_meta_from_isbn(options, output_folder_path)
 
         if options.generate_meta_from_text:
             print("Researching content data")
-            self.generate_meta_from_text(options, output_folder_path)
+            with self.measure("meta"):
+                self.generate_meta_from_text(options, output_folder_path)
 
         if options.cleanup_txts:
             txt_stem_names = self.find_txt_stem_names(output_folder_path)
-            for txt_stem_index in range(len(txt_stem_names)):
-                human_page_name = "".join(["page ", str(txt_stem_index + 1)])
-                print("".join(["Cleaning up text for ", human_page_name]))
-                txt_stem_name = txt_stem_names[txt_stem_index]
-                self.cleanup_txt_by_stem(output_folder_path, txt_stem_name)
+            print("".join(["Cleaning up text for ", str(len(txt_stem_names)), " pages"]))
+            with self.measure("cleanup"):
+                for txt_stem_name in txt_stem_names:
+                    self.cleanup_txt_by_stem(output_folder_path, txt_stem_name)
+
+        if self.reclaimed_byte_count > 0:
+            reclaimed_megabyte_text = format(self.reclaimed_byte_count / (1024 * 1024), ".1f")
+            print("".join(["Reclaimed ", reclaimed_megabyte_text, " MB of working files"]))
+
+        self.manifest.complete_stage("publication")
+        self.add_to_library_search(options, output_folder_path)
+
+    def finalise_publication(self, output_folder_path: str) -> bool:
+        # only redone when the publication is rebuilt or the finalising
+        # options change, as hashing every page image isn't free
+        finaliser = self.scheduler.finaliser
+        finalise_signature = finaliser.signature()
+        if self.manifest.finalised == finalise_signature:
+            return False
+        print("Finalising output")
+        with self.measure("finalise"):
+            structure_file_path = os.path.join(output_folder_path, "structure.json")
+            if os.path.exists(structure_file_path):
+                finaliser.name_page_images(output_folder_path, structure_file_path)
+            for file_name in ["structure.json", "search.json", "meta.json"]:
+                file_path = os.path.join(output_folder_path, file_name)
+                if os.path.exists(file_path):
+                    finaliser.finalise_file(file_path, minify=True)
+        with self.manifest.lock:
+            self.manifest.finalised = finalise_signature
+            self.manifest.save()
+        return True
+
+    def add_to_library_search(self, options: Options, output_folder_path: str) -> None:
+        library_search = self.scheduler.library_search
+        if library_search is None or self.manifest.is_stage_complete("library_search"):
+            return
+        print("Adding to library search")
+        publication_folder = os.path.basename(os.path.normpath(output_folder_path))
+        with self.measure("library_search"):
+            library_search.add_publication(
+                publication_folder, output_folder_path, self.manifest
+            )
+
+    def find_pending_page_numbers(self, page_count: int) -> list[int]:
+        pending_page_numbers = list[int]()
+        for page_number in range(1, page_count + 1):
+            page_stem_name = "".join(["page", str(page_number - 1).zfill(4)])
+            if not self.manifest.is_page_complete(page_stem_name, self.inventory):
+                pending_page_numbers.append(page_number)
+        return pending_page_numbers
+
+    def extract_pages(
+        self, options: Options, pdf_file_path: str, output_folder_path: str
+    ) -> None:
+        with self.measure("text_layer"):
+            text_layer_txts = self.find_text_layer_txts(options, pdf_file_path)
+        text_layer_txt_by_page_number = self.find_usable_text_layer_txts(
+            options, text_layer_txts
+        )
+
+        if options.generate_pngs:
+            page_count = len(text_layer_txts)
+            if page_count == 0 and len(self.manifest.artefacts_by_page_stem_name) > 0:
+                with self.measure("rasterise"):
+                    page_count = self.find_pdf_page_count(pdf_file_path)
+            pending_page_numbers = self.find_pending_page_numbers(page_count)
+
+            if page_count == 0:
+                with self.measure("rasterise"):
+                    self.generate_png_files(
+                        pdf_file_path,
+                        output_folder_path,
+                        resolution=self.find_ocr_render_resolution(options),
+                    )
+            else:
+                # only pages missing from an earlier, interrupted run are rendered
+                raster_chunks = self.plan_raster_chunks(
+                    options, pending_page_numbers, text_layer_txt_by_page_number, page_count
+                )
+                for first_page_number, last_page_number, resolution in raster_chunks:
+                    with self.measure("rasterise"):
+                        self.generate_png_files(
+                            pdf_file_path,
+                            output_folder_path,
+                            first_page_number,
+                            last_page_number,
+                            resolution,
+                        )
+            png_stem_name_by_page_number = self.find_raw_png_stem_names(
+                output_folder_path
+            )
+        else:
+            png_stem_name_by_page_number = dict[int, str]()
+            png_stem_names = self.find_png_stem_names(output_folder_path)
+            for png_stem_index in range(len(png_stem_names)):
+                png_stem_name_by_page_number[png_stem_index + 1] = png_stem_names[
+                    png_stem_index
+                ]
+
+        # pages are independent of each other so the border, ocr and jpg
+        # chain for each can be run side by side
+        page_argument_lists = list[list]()
+        for page_number in sorted(png_stem_name_by_page_number.keys()):
+            page_stem_name = "".join(["page", str(page_number - 1).zfill(4)])
+            if self.manifest.is_page_complete(page_stem_name, self.inventory):
+                continue
+            page_argument_lists.append(
+                [
+                    options,
+                    output_folder_path,
+                    png_stem_name_by_page_number[page_number],
+                    page_number - 1,
+                    text_layer_txt_by_page_number.get(page_number),
+                ]
+            )
+        self.scheduler.run_pages(self.extract_page, page_argument_lists)
+
+        # each page removes its own png once done, this catches any left over
+        # from pages that were already complete
+        if options.cleanup_pngs:
+            for page_number in sorted(png_stem_name_by_page_number.keys()):
+                png_stem_name = png_stem_name_by_page_number[page_number]
+                png_file_name = "".join([png_stem_name, ".png"])
+                if self.inventory.contains(png_file_name):
+                    self.cleanup_png_by_stem(output_folder_path, png_stem_name)
+
+    def extract_pages_streamed(
+        self, options: Options, pdf_file_path: str, output_folder_path: str
+    ) -> None:
+        # pages are rasterised a chunk at a time and each raw png is removed
+        # as soon as its page is done, so only a bounded number of them are
+        # ever on disk at once
+        chunk_page_count = max(
+            1, min(options.raster_chunk_page_count, options.raw_page_limit)
+        )
+        raw_page_slots = threading.BoundedSemaphore(options.raw_page_limit)
+
+        with self.measure("text_layer"):
+            text_layer_txts = self.find_text_layer_txts(options, pdf_file_path)
+        text_layer_txt_by_page_number = self.find_usable_text_layer_txts(
+            options, text_layer_txts
+        )
+        page_count = len(text_layer_txts)
+        if page_count == 0:
+            with self.measure("rasterise"):
+                page_count = self.find_pdf_page_count(pdf_file_path)
+        pending_page_numbers = self.find_pending_page_numbers(page_count)
+        raster_chunks = self.plan_raster_chunks(
+            options, pending_page_numbers, text_layer_txt_by_page_number, chunk_page_count
+        )
+
+        def generate_page_argument_lists():
+            for first_page_number, last_page_number, resolution in raster_chunks:
+                for _ in range(first_page_number, last_page_number + 1):
+                    raw_page_slots.acquire()
+
+                with self.measure("rasterise"):
+                    self.generate_png_files(
+                        pdf_file_path,
+                        output_folder_path,
+                        first_page_number,
+                        last_page_number,
+                        resolution,
+                    )
+
+                png_stem_name_by_page_number = self.find_raw_png_stem_names(
+                    output_folder_path
+                )
+                for page_number in range(first_page_number, last_page_number + 1):
+                    if page_number not in png_stem_name_by_page_number:
+                        raw_page_slots.release()
+                        continue
+                    yield [
+                        options,
+                        output_folder_path,
+                        png_stem_name_by_page_number[page_number],
+                        page_number - 1,
+                        text_layer_txt_by_page_number.get(page_number),
+                        raw_page_slots,
+                    ]
+
+        self.scheduler.run_pages(
+            self.extract_streamed_page, generate_page_argument_lists()
+        )
+
+    def extract_streamed_page(
+        self,
+        options: Options,
+        output_folder_path: str,
+        png_stem_name: str,
+        png_stem_index: int,
+        text_layer_txt: str,
+        raw_page_slots: threading.BoundedSemaphore,
+    ) -> None:
+        try:
+            self.extract_page(
+                options, output_folder_path, png_stem_name, png_stem_index, text_layer_txt
+            )
+        finally:
+            raw_page_slots.release()
+
+    def extract_page(
+        self,
+        options: Options,
+        output_folder_path: str,
+        png_stem_name: str,
+        png_stem_index: int,
+        text_layer_txt: str = None,
+    ) -> None:
+        page_png_stem_name = "".join(["page", str(png_stem_index).zfill(4)])
+        human_page_name = "".join(["page ", str(png_stem_index + 1)])
+
+        png_file_name = "".join([png_stem_name, ".png"])
+        input_png_path = os.path.join(output_folder_path, png_file_name)
+        output_txt_path = os.path.join(output_folder_path, page_png_stem_name)
+
+        # pages with a usable text layer skip the border and ocr steps entirely
+        requires_ocr = options.extract_text and text_layer_txt is None
+        output_txt_file_path = "".join([output_txt_path, ".txt"])
+        if options.extract_text and text_layer_txt is not None:
+            print("".join(["Using text layer from ", human_page_name]))
+            with open(output_txt_file_path, "w") as output_txt_file:
+                output_txt_file.write(text_layer_txt)
+
+        ocr_cache = self.scheduler.ocr_cache
+        ocr_cache_key = None
+        if requires_ocr and ocr_cache is not None:
+            ocr_cache_key = ocr_cache.key_for(input_png_path)
+            cached_txt = ocr_cache.find(ocr_cache_key)
+            if cached_txt is not None:
+                print("".join(["Using cached text for ", human_page_name]))
+                with open(output_txt_file_path, "w") as output_txt_file:
+                    output_txt_file.write(cached_txt)
+                requires_ocr = False
+                ocr_cache_key = None
+
+        # only pages that were rendered for ocr can be larger than the images
+        # need to be
+        image_scale = 1.0
+        if text_layer_txt is None and options.image_resolution is not None:
+            image_scale = options.image_resolution / self.find_ocr_render_resolution(options)
+
+        if self.uses_pillow(options):
+            # decode the page once and derive both the ocr input and the jpg
+            # from the same pixels instead of two convert round trips
+            with Image.open(input_png_path) as page_image:
+                page_image.load()
+
+                if requires_ocr:
+                    ocr_resolution = self.find_ocr_render_resolution(options)
+                    if options.adaptive_ocr:
+                        with self.measure("preprocess"):
+                            row_profile = self.find_image_row_profile(page_image)
+                            ocr_resolution = self.plan_ocr_resolution(options, row_profile)
+
+                    if ocr_resolution is None:
+                        print("".join(["Skipping blank ", human_page_name]))
+                        with open(output_txt_file_path, "w") as output_txt_file:
+                            output_txt_file.write("")
+                    else:
+                        print("".join(["Extracting text from ", human_page_name]))
+                        with self.measure("border"):
+                            bordered_image = self.prepare_ocr_image(
+                                options, page_image, ocr_resolution
+                            )
+                        self.extract_txt_from_image(
+                            bordered_image, output_txt_path, ocr_resolution
+                        )
+
+                page_images = list[dict]()
+                if options.generate_jpgs:
+                    print("".join(["Optimising image from ", human_page_name]))
+                    image_tiers = self.plan_image_tiers(
+                        options,
+                        max(1, round(page_image.width * image_scale)),
+                        max(1, round(page_image.height * image_scale)),
+                    )
+                    with self.measure("jpg"):
+                        page_images = self.save_jpg_image(
+                            page_image,
+                            output_folder_path,
+                            page_png_stem_name,
+                            image_tiers,
+                            options.image_formats,
+                        )
+            self.store_cached_txt(ocr_cache_key, output_txt_file_path)
+            self.complete_page(options, page_png_stem_name, page_images)
+            if options.cleanup_pngs:
+                self.cleanup_png_by_stem(output_folder_path, png_stem_name)
+            return
+
+        ocr_resolution = self.find_ocr_render_resolution(options)
+        if requires_ocr and options.adaptive_ocr:
+            with self.measure("preprocess"):
+                row_profile = self.find_png_row_profile(input_png_path)
+                ocr_resolution = self.plan_ocr_resolution(options, row_profile)
+            if ocr_resolution is None:
+                print("".join(["Skipping blank ", human_page_name]))
+                with open(output_txt_file_path, "w") as output_txt_file:
+                    output_txt_file.write("")
+                requires_ocr = False
+
+        if requires_ocr:
+            print("".join(["Extracting text from ", human_page_name]))
+
+            with self.measure("border"):
+                self.generate_bordered_png_file(
+                    output_folder_path,
+                    page_png_stem_name,
+                    input_png_path,
+                    ocr_resolution / self.find_ocr_render_resolution(options),
+                    options.ocr_preprocess,
+                )
+
+            bordered_png_file_name = "".join([page_png_stem_name, ".bordered.png"])
+            bordered_png_path = os.path.join(output_folder_path, bordered_png_file_name)
+
+            self.extract_txt_file(bordered_png_path, output_txt_path, ocr_resolution)
+            self.delete_files(output_folder_path, [bordered_png_file_name])
+
+        page_images = list[dict]()
+        if options.generate_jpgs:
+            print("".join(["Optimising image from ", human_page_name]))
+            png_width, png_height = self.find_png_size(input_png_path)
+            image_tiers = self.plan_image_tiers(
+                options,
+                max(1, round(png_width * image_scale)),
+                max(1, round(png_height * image_scale)),
+            )
+            with self.measure("jpg"):
+                page_images = self.generate_jpg_file(
+                    output_folder_path,
+                    page_png_stem_name,
+                    input_png_path,
+                    image_tiers,
+                    options.image_formats,
+                )
+
+        self.store_cached_txt(ocr_cache_key, output_txt_file_path)
+        self.complete_page(options, page_png_stem_name, page_images)
+        if options.cleanup_pngs:
+            self.cleanup_png_by_stem(output_folder_path, png_stem_name)
+
+    def store_cached_txt(self, ocr_cache_key: str, txt_file_path: str) -> None:
+        if ocr_cache_key is None:
+            return
+        with open(txt_file_path, "r") as txt_file:
+            txt_contents = txt_file.read()
+        self.scheduler.ocr_cache.store(ocr_cache_key, txt_contents)
+
+    def complete_page(
+        self, options: Options, page_stem_name: str, page_images: list[dict]
+    ) -> None:
+        # artefacts are the file name suffixes after the page stem, e.g. jpg
+        # or thumbnail.jpg
+        artefacts = list[str]()
+        for page_image in page_images:
+            artefacts.append(page_image["file"][len(page_stem_name) + 1 :])
+        if options.extract_text:
+            artefacts.append("txt")
+
+        inventory = self.find_inventory(self.manifest.output_folder_path)
+        for artefact in artefacts:
+            inventory.add("".join([page_stem_name, ".", artefact]))
+        self.manifest.complete_page(page_stem_name, artefacts, page_images)
+
+    def find_ocr_render_resolution(self, options: Options) -> int:
+        # pages that need ocr are rendered once, at whichever of the ocr and
+        # image resolutions is higher, and scaled down for the other
+        if options.image_resolution is None:
+            return options.page_resolution
+        return max(options.page_resolution, options.image_resolution)
+
+    def find_image_row_profile(self, page_image) -> list[int]:
+        # squashing the thresholded page to a single pixel wide leaves the
+        # average of each row, 0 for solid ink through to 255 for blank paper
+        grey_image = page_image.convert("L").point(Extractor.binarise_table)
+        row_image = grey_image.resize((1, grey_image.height), Image.BOX)
+        return list(row_image.getdata())
+
+    def find_png_row_profile(self, input_png_path: str) -> list[int]:
+        _, png_height = self.find_png_size(input_png_path)
+        row_profile_command = [
+            "convert",
+            input_png_path,
+            "-colorspace",
+            "Gray",
+            "-threshold",
+            "50%",
+            "-filter",
+            "Box",
+            "-resize",
+            "".join(["1x", str(png_height), "!"]),
+            "-depth",
+            "8",
+            "-compress",
+            "none",
+            "pgm:-",
+        ]
+        runner = Runner()
+        row_profile_result = runner.execute(row_profile_command)
+        if len(row_profile_result.error_text) > 0:
+            raise ToolError(row_profile_command, row_profile_result.error_text)
+        # a plain pgm, P2 width height maximum then one value per row
+        pgm_values = row_profile_result.output_text.split()
+        return [int(pgm_value) for pgm_value in pgm_values[4:]]
+
+    def plan_ocr_resolution(self, options: Options, row_profile: list[int]) -> int:
+        # the resolution to ocr the page at, or None when it is blank
+        render_resolution = self.find_ocr_render_resolution(options)
+        if len(row_profile) == 0:
+            return options.page_resolution
+        ink_by_row = [1.0 - row_mean / 255 for row_mean in row_profile]
+        if sum(ink_by_row) / len(ink_by_row) < options.blank_page_ink_threshold:
+            return None
+
+        # lines of text show up as runs of inked rows between gaps of paper,
+        # measured against the page's own background speckle
+        background_ink = sorted(ink_by_row)[len(ink_by_row) // 5]
+        line_heights = list[int]()
+        line_height = 0
+        for row_ink in ink_by_row + [0.0]:
+            if row_ink > background_ink + 0.01:
+                line_height += 1
+                continue
+            # runs of a few rows are specks, and runs of an eighth of the page
+            # are pictures rather than text
+            if 3 <= line_height < len(ink_by_row) // 8:
+                line_heights.append(line_height)
+            line_height = 0
+
+        minimum_resolution = min(options.minimum_ocr_resolution, options.page_resolution)
+        if len(line_heights) == 0:
+            # nothing that looks like text, most likely a full page picture
+            return minimum_resolution
+
+        typical_line_height = sorted(line_heights)[len(line_heights) // 2]
+        resolution = render_resolution * options.ocr_line_height / typical_line_height
+        return int(max(minimum_resolution, min(options.page_resolution, resolution)))
+
+    def prepare_ocr_image(self, options: Options, page_image, ocr_resolution: int):
+        ocr_image = page_image
+        scale = ocr_resolution / self.find_ocr_render_resolution(options)
+        if scale < 1.0:
+            ocr_image = ocr_image.resize(
+                (max(1, round(ocr_image.width * scale)), max(1, round(ocr_image.height * scale))),
+                Image.LANCZOS,
+            )
+        if options.ocr_preprocess in ("grayscale", "binarise"):
+            ocr_image = ocr_image.convert("L")
+        if options.ocr_preprocess == "binarise":
+            ocr_image = ocr_image.point(Extractor.binarise_table)
+        return ImageOps.expand(ocr_image, border=10, fill="white")
+
+    def plan_image_tiers(self, options: Options, width: int, height: int) -> list[list]:
+        # [file name suffix, width, height] from the largest tier down, tiers
+        # that wouldn't be smaller than the full page are left out
+        image_tiers = list[list]([["", width, height]])
+        tier_widths = sorted(options.image_tier_widths.items(), key=lambda item: -item[1])
+        for tier_name, tier_width in tier_widths:
+            if tier_width >= width:
+                continue
+            tier_height = max(1, round(height * tier_width / width))
+            image_tiers.append(["".join([".", tier_name]), tier_width, tier_height])
+        return image_tiers
+
+    def find_png_size(self, png_file_path: str) -> list[int]:
+        # the width and height sit in the IHDR chunk straight after the signature
+        with open(png_file_path, "rb") as png_file:
+            png_header = png_file.read(24)
+        if len(png_header) < 24 or png_header[:8] != b"\x89PNG\r\n\x1a\n":
+            return [0, 0]
+        png_width, png_height = struct.unpack(">II", png_header[16:24])
+        return [png_width, png_height]
+
+    def describe_page_image(
+        self, page_stem_name: str, image_tier: list, image_format: str
+    ) -> dict:
+        mime_type_by_image_format = {
+            "jpg": "image/jpeg",
+            "webp": "image/webp",
+            "avif": "image/avif",
+        }
+        return {
+            "file": "".join([page_stem_name, image_tier[0], ".", image_format]),
+            "width": image_tier[1],
+            "height": image_tier[2],
+            "type": mime_type_by_image_format[image_format],
+        }
+
+    def uses_pillow(self, options: Options) -> bool:
+        if options.imaging_backend == "convert":
+            return False
+        if Image is None:
+            if options.imaging_backend == "pillow":
+                print("Pillow is not installed, falling back to convert")
+            return False
+        return True
 
     def generate_meta_from_text(self, options, output_folder_path):
         meta_file_name = "meta.json"
@@ -146,7 +2338,23 @@ class Extractor:
         if not attempt_meta_file_generation:
             return
 
-    def generate_meta_from_isbn(self, options, output_folder_path):
+    def submit_meta_from_isbn(self, options, output_folder_path):
+        if self.manifest.is_stage_complete("meta_from_isbn"):
+            return
+        isbn_lookup = self.scheduler.isbn_lookup
+        meta_futures = list[concurrent.futures.Future]()
+        for potential_isbn in self.manifest.isbns:
+            meta_futures.append(isbn_lookup.submit(potential_isbn))
+        self.scheduler.submit_metadata(
+            self.measure_meta_from_isbn, options, output_folder_path, meta_futures
+        )
+
+    def measure_meta_from_isbn(self, options, output_folder_path, meta_futures):
+        # includes the time spent waiting on the books api
+        with self.measure("meta"):
+            self.generate_meta_from_isbn(options, output_folder_path, meta_futures)
+
+    def generate_meta_from_isbn(self, options, output_folder_path, meta_futures):
         meta_file_name = "meta.json"
         meta_file_path = os.path.join(output_folder_path, meta_file_name)
         meta_file_exists = os.path.exists(meta_file_path)
@@ -156,78 +2364,55 @@ class Extractor:
             attempt_meta_file_generation = False
 
         if not attempt_meta_file_generation:
+            self.manifest.complete_stage("meta_from_isbn")
             return
 
-        potential_isbns = self.find_isbns(output_folder_path)
-        if len(potential_isbns) > 0:
-            for potential_isbn in potential_isbns:
-                meta = self.lookup_meta_by_isbn(potential_isbn)
-                if meta is None:
-                    continue
-                with open(meta_file_path, "w") as meta_file:
-                    meta_file.write("{\n")
-
-                    meta_file.write('  "isbn" : "')
-                    meta_file.write(meta.isbn)
-                    meta_file.write('",\n')
-
-                    meta_file.write('  "title" : "')
-                    meta_file.write(meta.title)
-                    meta_file.write('",\n')
-
-                    meta_file.write('  "authors" : [\n')
-                    is_first_author = True
-                    for author in meta.authors:
-                        if is_first_author:
-                            is_first_author = False
-                        else:
-                            meta_file.write(",\n")
-                        meta_file.write('    "')
-                        meta_file.write(author)
-                        meta_file.write('"\n')
-
-                    meta_file.write("  ],\n")
-
-                    meta_file.write('  "thumbnail_url" : "')
-                    meta_file.write(meta.thumbnail_url)
-                    meta_file.write('"\n')
-
-                    meta_file.write("}\n")
+        # every candidate is looked up at once, but the first one the api
+        # recognises still wins
+        meta = None
+        has_failed_lookup = False
+        for meta_future in meta_futures:
+            if meta_future.exception() is not None:
+                has_failed_lookup = True
+                continue
+            meta = meta_future.result()
+            if meta is not None:
                 break
 
-    def generate_structure(self, options):
-        directory_names = list[str]()
-        for directory_path, _, _ in os.walk(options.output_root_path):
-            directory_name_split = os.path.split(directory_path)
-            parent_directory_name = directory_name_split[0]
-            if len(parent_directory_name) == 0:
-                continue
-            directory_name = directory_name_split[1]
-            directory_names.append(directory_name)
+        if meta is not None:
+            # titles and names can hold quotes and backslashes, so they are
+            # left to json to escape
+            meta_contents = {
+                "isbn": meta.isbn,
+                "title": meta.title,
+                "authors": meta.authors,
+                "thumbnail_url": meta.thumbnail_url,
+            }
+            with open(meta_file_path, "w") as meta_file:
+                json.dump(meta_contents, meta_file, indent=2)
+                meta_file.write("\n")
+            self.scheduler.finaliser.finalise_file(meta_file_path, minify=True)
+
+            # the catalogue carries each book's title and authors
+            catalogue = self.scheduler.catalogue
+            if catalogue is not None:
+                catalogue.add_publication(os.path.basename(os.path.normpath(output_folder_path)))
+
+        # left incomplete after a network failure, so the next run tries again
+        if meta is not None or not has_failed_lookup:
+            self.manifest.complete_stage("meta_from_isbn")
 
-        structure_file_name = "structure.json"
-        structure_file_path = os.path.join(
-            options.output_root_path, structure_file_name
+    def generate_structure(self, options):
+        catalogue = LibraryCatalogue(
+            options.output_root_path, options.catalogue_chunk_size, OutputFinaliser(options)
         )
-        with open(structure_file_path, "w") as structure_file:
-            structure_file.write("{\n")
-
-            structure_file.write('  "publications" : [\n')
-            is_first_directory = True
-            for directory_name in directory_names:
-                if is_first_directory:
-                    is_first_directory = False
-                else:
-                    structure_file.write(",\n")
-                structure_file.write('    { "folder" : "')
-                structure_file.write(directory_name)
-                structure_file.write('"')
-
-                structure_file.write(" }")
-            structure_file.write("\n  ]\n")
-            structure_file.write("}\n")
+        catalogue.save()
 
     def generate_pdf_structure(self, output_folder_path):
+        images_by_page_stem_name = dict[str, list[dict]]()
+        if self.manifest is not None and self.manifest.output_folder_path == output_folder_path:
+            images_by_page_stem_name = self.manifest.images_by_page_stem_name
+
         structure_file_name = "structure.json"
         structure_file_path = os.path.join(output_folder_path, structure_file_name)
         with open(structure_file_path, "w") as sturcture_file:
@@ -246,6 +2431,16 @@ class Extractor:
                 sturcture_file.write(jpg_file_name)
                 sturcture_file.write('"')
 
+                # every tier and format of the page, smallest first, ready to
+                # be turned into a srcset
+                page_images = images_by_page_stem_name.get(txt_stem_name, list())
+                page_images = sorted(page_images, key=lambda page_image: page_image["width"])
+                if len(page_images) > 0:
+                    sturcture_file.write(', "thumbnail" : ')
+                    sturcture_file.write(json.dumps(page_images[0]["file"]))
+                    sturcture_file.write(', "images" : ')
+                    sturcture_file.write(json.dumps(page_images, separators=(",", ":")))
+
                 sturcture_file.write(" }")
             sturcture_file.write("\n  ]\n")
 
@@ -255,38 +2450,48 @@ class Extractor:
         count_by_word_by_page_stem_name = self.calculate_word_frequencies_by_page(
             output_folder_path
         )
-        count_by_word = dict[str, dict[str, int]]()
-        for page_stem_name in count_by_word_by_page_stem_name.keys():
+        page_stem_names = sorted(count_by_word_by_page_stem_name.keys())
+
+        # word -> [page delta, count, page delta, count, ...] where each page
+        # delta is the distance from the previous page the word appeared on
+        postings_by_word = dict[str, list[int]]()
+        previous_page_index_by_word = dict[str, int]()
+        for page_index in range(len(page_stem_names)):
+            page_stem_name = page_stem_names[page_index]
             page_specific_count_by_word = count_by_word_by_page_stem_name[
                 page_stem_name
             ]
             for word in page_specific_count_by_word.keys():
-                count = page_specific_count_by_word[word]
-                existing_count = 0
-                if word in count_by_word:
-                    existing_count = count_by_word[word]
-                count += existing_count
-                count_by_word[word] = count
+                if word not in postings_by_word:
+                    postings_by_word[word] = list[int]()
+                    previous_page_index_by_word[word] = 0
+                page_delta = page_index - previous_page_index_by_word[word]
+                previous_page_index_by_word[word] = page_index
+                postings_by_word[word].append(page_delta)
+                postings_by_word[word].append(page_specific_count_by_word[word])
 
         search_file_name = "search.json"
         search_file_path = os.path.join(output_folder_path, search_file_name)
         with open(search_file_path, "w") as search_file:
             search_file.write("{\n")
 
-            search_file.write('  "word_frequencies" : [\n')
-            is_first_word_frequency = True
-            for word in count_by_word:
-                count = count_by_word[word]
-                if is_first_word_frequency:
-                    is_first_word_frequency = False
+            search_file.write('  "pages" : [')
+            search_file.write(",".join(json.dumps(name) for name in page_stem_names))
+            search_file.write("],\n")
+
+            search_file.write('  "terms" : {\n')
+            is_first_word = True
+            for word in sorted(postings_by_word.keys()):
+                if is_first_word:
+                    is_first_word = False
                 else:
                     search_file.write(",\n")
-                search_file.write('    { "')
-                search_file.write(word)
-                search_file.write('" : ')
-                search_file.write(str(count))
-                search_file.write(" }")
-            search_file.write("\n  ]\n")
+                search_file.write("    ")
+                search_file.write(json.dumps(word))
+                search_file.write(" : [")
+                search_file.write(",".join(str(value) for value in postings_by_word[word]))
+                search_file.write("]")
+            search_file.write("\n  }\n")
 
             search_file.write("}\n")
 
@@ -296,42 +2501,50 @@ class Extractor:
         for page_txt_stem_name in page_txt_stem_names:
             page_txt_file_name = "".join([page_txt_stem_name, ".txt"])
             page_txt_file_path = os.path.join(output_folder_path, page_txt_file_name)
-            with open(page_txt_file_path, "r") as page_txt_file:
-                page_txt_contents = page_txt_file.read()
-            words = page_txt_contents.split()
-            count_by_word = dict[str, int]()
-            for word in words:
-                lower_word = word.lower()
-                safe_word_characters = list[str]()
-                for character in lower_word:
-                    if character in "abcdefghijklmnopqrstuvwxyz1234567890.,@$":
-                        safe_word_characters.append(character)
-                safe_word = "".join(safe_word_characters)
-                if len(safe_word) > 0:
-                    count = 0
-                    if safe_word in count_by_word:
-                        count = count_by_word[safe_word]
-                    count += 1
-                    count_by_word[safe_word] = count
+            count_by_word = self.tokenizer.count_words_in_file(page_txt_file_path)
             count_by_word_by_page_stem_name[page_txt_stem_name] = count_by_word
         return count_by_word_by_page_stem_name
 
     def cleanup_png_by_stem(self, output_folder_path: str, png_stem_name: str):
         png_file_name = "".join([png_stem_name, ".png"])
+        self.delete_files(output_folder_path, [png_file_name])
 
-        png_file_path = os.path.join(output_folder_path, png_file_name)
-        delete_png_command = ["rm", png_file_path]
-        runner = Runner()
-        delete_png_result = runner.execute(delete_png_command)
-        if len(delete_png_result.error_text) > 0:
-            print(delete_png_result.error_text)
-            exit()
+    def delete_files(self, output_folder_path: str, file_names: list[str]) -> int:
+        # a file that can't be removed is reported and skipped rather than
+        # stopping the whole library run
+        inventory = self.find_inventory(output_folder_path)
+        reclaimed_byte_count = 0
+        for file_name in file_names:
+            file_path = os.path.join(output_folder_path, file_name)
+            try:
+                file_size = os.path.getsize(file_path)
+                os.remove(file_path)
+            except OSError as error:
+                print("".join(["Unable to remove ", file_path, ": ", str(error)]))
+                continue
+            inventory.discard(file_name)
+            reclaimed_byte_count += file_size
+
+        with self.reclaimed_byte_count_lock:
+            self.reclaimed_byte_count += reclaimed_byte_count
+        return reclaimed_byte_count
 
     def generate_jpg_file(
-        self, output_folder_path: str, page_stem_name: str, input_png_path: str
-    ) -> None:
-        output_jpg_name = "".join([page_stem_name, ".jpg"])
-        output_jpg_path = os.path.join(output_folder_path, output_jpg_name)
+        self,
+        output_folder_path: str,
+        page_stem_name: str,
+        input_png_path: str,
+        image_tiers: list[list] = None,
+        image_formats: list[str] = None,
+    ) -> list[dict]:
+        if image_tiers is None:
+            png_width, png_height = self.find_png_size(input_png_path)
+            image_tiers = list[list]([["", png_width, png_height]])
+        if image_formats is None:
+            image_formats = list[str](["jpg"])
+
+        # a single convert decodes the page once and writes every tier and
+        # format, shrinking as it goes
         to_jpg_command = [
             "convert",
             input_png_path,
@@ -340,94 +2553,271 @@ class Extractor:
             "Plane",
             "-quality",
             "85%",
-            output_jpg_path,
         ]
+        page_images = list[dict]()
+        image_size = self.find_png_size(input_png_path)
+        for image_tier in image_tiers:
+            if image_tier[1:3] != image_size:
+                tier_size = "".join([str(image_tier[1]), "x", str(image_tier[2]), "!"])
+                to_jpg_command.extend(["-resize", tier_size])
+                image_size = image_tier[1:3]
+            for image_format in image_formats:
+                if image_format != "jpg" and not self.convert_supports(image_format):
+                    continue
+                page_image = self.describe_page_image(page_stem_name, image_tier, image_format)
+                output_image_path = os.path.join(output_folder_path, page_image["file"])
+                to_jpg_command.extend(["-write", output_image_path])
+                page_images.append(page_image)
+        to_jpg_command.append("null:")
+
         runner = Runner()
         to_jpg_result = runner.execute(to_jpg_command)
         if len(to_jpg_result.error_text) > 0:
-            print(to_jpg_result.error_text)
-            exit()
-    
+            raise ToolError(to_jpg_command, to_jpg_result.error_text)
+        return page_images
+
+    def convert_supports(self, image_format: str) -> bool:
+        return image_format in self.scheduler.find_convert_image_formats()
+
+    def save_jpg_image(
+        self,
+        page_image,
+        output_folder_path: str,
+        page_stem_name: str,
+        image_tiers: list[list] = None,
+        image_formats: list[str] = None,
+    ) -> list[dict]:
+        if image_tiers is None:
+            image_tiers = list[list]([["", page_image.width, page_image.height]])
+        if image_formats is None:
+            image_formats = list[str](["jpg"])
+
+        if page_image.mode not in ("RGB", "L"):
+            page_image = page_image.convert("RGB")
+
+        pillow_format_by_image_format = {"jpg": "JPEG", "webp": "WEBP", "avif": "AVIF"}
+        page_images = list[dict]()
+        for image_tier in image_tiers:
+            if (image_tier[1], image_tier[2]) != page_image.size:
+                page_image = page_image.resize((image_tier[1], image_tier[2]), Image.LANCZOS)
+            for image_format in image_formats:
+                if image_format != "jpg" and not self.pillow_supports(image_format):
+                    continue
+                described_image = self.describe_page_image(
+                    page_stem_name, image_tier, image_format
+                )
+                output_image_path = os.path.join(output_folder_path, described_image["file"])
+                # matches convert's -strip -interlace Plane -quality 85%
+                page_image.save(
+                    output_image_path,
+                    pillow_format_by_image_format[image_format],
+                    quality=85,
+                    progressive=True,
+                    optimize=True,
+                )
+                page_images.append(described_image)
+        return page_images
+
+    def pillow_supports(self, image_format: str) -> bool:
+        try:
+            return features.check(image_format)
+        except ValueError:
+            return False
+
     def generate_bordered_png_file(
-        self, output_folder_path: str, page_stem_name: str, input_png_path: str
+        self,
+        output_folder_path: str,
+        page_stem_name: str,
+        input_png_path: str,
+        scale: float = 1.0,
+        preprocess: str = "none",
     ) -> None:
         output_bordered_name = "".join([page_stem_name, ".bordered.png"])
         output_bordered_path = os.path.join(output_folder_path, output_bordered_name)
-        to_bordered_command = [
-            "convert",
-            input_png_path,
-            "-bordercolor",
-            "White",
-            "-border",
-            "10x10",
-            output_bordered_path,
-        ]
+        to_bordered_command = ["convert", input_png_path]
+        if scale < 1.0:
+            to_bordered_command.extend(["-resize", "".join([format(scale * 100, ".2f"), "%"])])
+        if preprocess in ("grayscale", "binarise"):
+            to_bordered_command.extend(["-colorspace", "Gray"])
+        if preprocess == "binarise":
+            to_bordered_command.extend(["-threshold", "50%"])
+        # the border goes on last so it stays the same width whatever the scale
+        to_bordered_command.extend(
+            ["-bordercolor", "White", "-border", "10x10", output_bordered_path]
+        )
         runner = Runner()
         to_bordered_result = runner.execute(to_bordered_command)
         if len(to_bordered_result.error_text) > 0:
-            print(to_bordered_result.error_text)
-            exit()
+            raise ToolError(to_bordered_command, to_bordered_result.error_text)
+        self.find_inventory(output_folder_path).add(output_bordered_name)
 
 
-    def extract_txt_file(self, input_png_path: str, output_txt_path: str) -> None:
-        to_txt_command = ["tesseract", input_png_path, output_txt_path]
-        runner = Runner()
-        to_txt_result = runner.execute(to_txt_command)
-        if len(
-            to_txt_result.error_text
-        ) > 0 and not to_txt_result.error_text.startswith("Detected"):
-            print(to_txt_result.error_text)
-            exit()
+    def extract_txt_file(
+        self, input_png_path: str, output_txt_path: str, resolution: int = None
+    ) -> None:
+        with self.measure("ocr"):
+            self.scheduler.ocr_engine.extract_txt_file(
+                input_png_path, output_txt_path, resolution
+            )
 
-    def generate_png_files(self, pdf_file_path: str, output_folder_path: str) -> None:
+    def extract_txt_from_image(
+        self, input_image, output_txt_path: str, resolution: int = None
+    ) -> None:
+        with self.measure("ocr"):
+            self.scheduler.ocr_engine.extract_txt_from_image(
+                input_image, output_txt_path, resolution
+            )
+
+    def generate_png_files(
+        self,
+        pdf_file_path: str,
+        output_folder_path: str,
+        first_page_number: int = None,
+        last_page_number: int = None,
+        resolution: int = 300,
+    ) -> None:
         page_file_prefix = "page"
         output_png_prefix_path = os.path.join(output_folder_path, page_file_prefix)
-        to_png_command = ["pdftoppm", "-r", "300", "-png", pdf_file_path, output_png_prefix_path]
+        to_png_command = ["pdftoppm", "-r", str(resolution), "-png"]
+        if first_page_number is not None:
+            to_png_command.extend(["-f", str(first_page_number)])
+        if last_page_number is not None:
+            to_png_command.extend(["-l", str(last_page_number)])
+        to_png_command.extend([pdf_file_path, output_png_prefix_path])
         runner = Runner()
         to_png_result = runner.execute(to_png_command)
         if len(to_png_result.error_text) > 0:
-            print(to_png_result.error_text)
-            exit()
+            raise ToolError(to_png_command, to_png_result.error_text)
+
+        inventory = self.find_inventory(output_folder_path)
+        if first_page_number is None or last_page_number is None:
+            # the whole pdf is rendered before any of its pages are worked
+            # on, so nothing else is changing the folder while it is listed
+            inventory.scan()
+            return
+        # when streaming, page workers are adding and removing files in the
+        # same folder meanwhile, so it is never listed here. a page pdftoppm
+        # didn't write is just left out
+        for page_number in range(first_page_number, last_page_number + 1):
+            self.add_raw_png_to_inventory(inventory, page_number)
+
+    def add_raw_png_to_inventory(self, inventory: PageInventory, page_number: int) -> None:
+        # pdftoppm zero pads page numbers to the width of the page count, so
+        # the few possible names are checked rather than listing the folder
+        page_number_text = str(page_number)
+        for padded_width in range(len(page_number_text), 7):
+            raw_png_file_name = "".join(
+                ["page-", page_number_text.zfill(padded_width), ".png"]
+            )
+            raw_png_file_path = os.path.join(inventory.folder_path, raw_png_file_name)
+            if os.path.exists(raw_png_file_path):
+                inventory.add(raw_png_file_name)
+                return
+
+    def find_text_layer_txts(self, options: Options, pdf_file_path: str) -> list[str]:
+        if not options.use_text_layer:
+            return list[str]()
+
+        to_txt_command = ["pdftotext", "-enc", "UTF-8", pdf_file_path, "-"]
+        runner = Runner()
+        to_txt_result = runner.execute(to_txt_command)
+        if len(to_txt_result.output_text) == 0:
+            if len(to_txt_result.error_text) > 0:
+                print(to_txt_result.error_text)
+            return list[str]()
+
+        # pdftotext ends every page with a form feed
+        text_layer_txts = to_txt_result.output_text.split("\f")
+        if len(text_layer_txts[-1].strip()) == 0:
+            del text_layer_txts[-1]
+        return text_layer_txts
+
+    def find_usable_text_layer_txts(
+        self, options: Options, text_layer_txts: list[str]
+    ) -> dict[int, str]:
+        text_layer_txt_by_page_number = dict[int, str]()
+        for page_index in range(len(text_layer_txts)):
+            text_layer_txt = text_layer_txts[page_index]
+            character_count = 0
+            for character in text_layer_txt:
+                if character.isalnum():
+                    character_count += 1
+            if character_count >= options.text_layer_threshold:
+                text_layer_txt_by_page_number[page_index + 1] = text_layer_txt
+        return text_layer_txt_by_page_number
+
+    def plan_raster_chunks(
+        self,
+        options: Options,
+        page_numbers: list[int],
+        text_layer_txt_by_page_number: dict[int, str],
+        chunk_page_count: int,
+    ) -> list[list[int]]:
+        # runs of neighbouring pages that share a resolution are rendered by
+        # a single pdftoppm call, up to chunk_page_count pages each
+        raster_chunks = list[list[int]]()
+        for page_number in page_numbers:
+            resolution = self.find_ocr_render_resolution(options)
+            if page_number in text_layer_txt_by_page_number:
+                resolution = options.text_layer_resolution
+                if options.image_resolution is not None:
+                    resolution = options.image_resolution
+
+            if len(raster_chunks) > 0:
+                raster_chunk = raster_chunks[-1]
+                raster_chunk_page_count = raster_chunk[1] - raster_chunk[0] + 1
+                if (
+                    raster_chunk[1] == page_number - 1
+                    and raster_chunk[2] == resolution
+                    and raster_chunk_page_count < chunk_page_count
+                ):
+                    raster_chunk[1] = page_number
+                    continue
+
+            raster_chunks.append([page_number, page_number, resolution])
+        return raster_chunks
+
+    def find_pdf_page_count(self, pdf_file_path: str) -> int:
+        page_count_command = ["pdfinfo", pdf_file_path]
+        runner = Runner()
+        page_count_result = runner.execute(page_count_command)
+        for line in page_count_result.output_text.splitlines():
+            if line.startswith("Pages:"):
+                return int(line[len("Pages:") :].strip())
+        raise ToolError(page_count_command, page_count_result.error_text)
+
+    def find_raw_png_stem_names(self, output_folder_path: str) -> dict[int, str]:
+        # pdftoppm names its pages page-N.png, zero padded to suit the page count
+        raw_png_stem_name_by_page_number = dict[int, str]()
+        for png_stem_name in self.find_png_stem_names(output_folder_path):
+            if not png_stem_name.startswith("page-"):
+                continue
+            page_number_text = png_stem_name[len("page-") :]
+            if not page_number_text.isdigit():
+                continue
+            raw_png_stem_name_by_page_number[int(page_number_text)] = png_stem_name
+        return raw_png_stem_name_by_page_number
+
+    def find_inventory(self, output_folder_path: str) -> PageInventory:
+        if self.inventory is not None and self.inventory.folder_path == output_folder_path:
+            return self.inventory
+        return PageInventory(output_folder_path)
 
     def find_png_stem_names(self, output_folder_path: str) -> list[str]:
-        png_stem_names = list[str]()
-        for root, dirs, file_names in os.walk(output_folder_path):
-            for file_name in file_names:
-                if file_name.endswith(".png"):
-                    stem_name = Path(file_name).stem
-                    png_stem_names.append(stem_name)
-        png_stem_names.sort()
-        return png_stem_names
+        return self.find_inventory(output_folder_path).find_stem_names(".png")
 
     def find_txt_stem_names(self, output_folder_path: str) -> list[str]:
-        txt_stem_names = list[str]()
-        for root, dirs, file_names in os.walk(output_folder_path):
-            for file_name in file_names:
-                if file_name.endswith(".txt"):
-                    stem_name = Path(file_name).stem
-                    txt_stem_names.append(stem_name)
-        txt_stem_names.sort()
-        return txt_stem_names
+        return self.find_inventory(output_folder_path).find_stem_names(".txt")
 
     def cleanup_txt_by_stem(self, output_folder_path: str, txt_stem_name: str):
         txt_file_name = "".join([txt_stem_name, ".txt"])
-        txt_file_path = os.path.join(output_folder_path, txt_file_name)
-        delete_txt_command = ["rm", txt_file_path]
-        runner = Runner()
-        delete_txt_result = runner.execute(delete_txt_command)
-        if len(delete_txt_result.error_text) > 0:
-            print(delete_txt_result.error_text)
-            exit()
+        file_names = list[str]([txt_file_name])
 
         bordered_file_name = "".join([txt_stem_name, ".bordered.png"])
-        bordered_file_path = os.path.join(output_folder_path, bordered_file_name)
-        delete_bordered_command = ["rm", bordered_file_path]
-        runner = Runner()
-        delete_bordered_result = runner.execute(delete_bordered_command)
-        if len(delete_bordered_result.error_text) > 0:
-            print(delete_bordered_result.error_text)
-            exit()
+        if self.find_inventory(output_folder_path).contains(bordered_file_name):
+            file_names.append(bordered_file_name)
 
+        self.delete_files(output_folder_path, file_names)
 
     def find_isbns(self, output_folder_path) -> list[str]:
         page_txt_stem_names = self.find_txt_stem_names(output_folder_path)
@@ -450,15 +2840,19 @@ class Extractor:
             ]
         )
 
+        # every prefix contains one of these, so most lines are skipped early
+        isbn_prefix_pattern = re.compile("ISBN|International Standard Book Number")
+
         isbns = list[str]()
 
         for page_txt_stem_name in page_txt_stem_names:
             page_txt_file_name = "".join([page_txt_stem_name, ".txt"])
             page_txt_file_path = os.path.join(output_folder_path, page_txt_file_name)
-            with open(page_txt_file_path, "r") as page_txt_file:
-                page_txt_lines = page_txt_file.readlines()
 
-            for line in page_txt_lines:
+            for line in self.tokenizer.read_lines(page_txt_file_path):
+                if isbn_prefix_pattern.search(line) is None:
+                    continue
+
                 prefix_found = False
                 prefix_end_index = 0
                 for prefix in isbn_prefixes:
@@ -477,7 +2871,7 @@ class Extractor:
 
                 number_characters = list[str]()
                 character_index = prefix_end_index + 2
-                while len(number_characters) < 13:
+                while len(number_characters) < 13 and character_index < len(line):
                     character = line[character_index]
                     if not character in valid_characters:
                         break
@@ -489,90 +2883,387 @@ class Extractor:
                     isbns.append(isbn)
         return isbns
 
-    def lookup_meta_by_isbn(self, potential_isbn: str) -> Meta:
-        url = "https://www.googleapis.com/books/v1/volumes?q=isbn:" + potential_isbn
-        lookup_response_data = urllib.request.urlopen(url).read()
-        lookup_response_text = lookup_response_data.decode("utf-8")
-        lookup_response = json.loads(lookup_response_text)
-
-        isbn: str = None
-
-        found_match = lookup_response["totalItems"] > 0
-        if found_match:
-            isbn = potential_isbn
-
-        if (not found_match) and len(potential_isbn) > 10:
-            potential_short_isbn = potential_isbn[:10]
-            url = (
-                "https://www.googleapis.com/books/v1/volumes?q=isbn:"
-                + potential_short_isbn
-            )
-            lookup_response_data = urllib.request.urlopen(url).read()
-            lookup_response_text = lookup_response_data.decode("utf-8")
-            lookup_response = json.loads(lookup_response_text)
-            found_match = lookup_response["totalItems"] > 0
-            if found_match:
-                isbn = potential_short_isbn
-
-        if not found_match:
+def find_pdf_file_names(input_root_path: str) -> list[str]:
+    pdf_file_names = list[str]()
+    for root, dirs, file_names in os.walk(input_root_path):
+        for file_name in file_names:
+            if file_name.endswith(".pdf"):
+                pdf_file_names.append(file_name)
+    return pdf_file_names
+
+
+def is_reserved_folder_name(folder_name: str) -> bool:
+    # the library's own folders, and hidden ones the library never looks in.
+    # a name that only looks like one of these once escaped is reserved too,
+    # so no two PDFs can end up sharing a folder
+    if folder_name in (LibrarySearchIndex.folder_name, LibraryCatalogue.folder_name):
+        return True
+    if folder_name.startswith("."):
+        return True
+    return folder_name.startswith("_") and is_reserved_folder_name(folder_name[1:])
+
+
+def find_output_folder_name(pdf_file_name: str) -> str:
+    pdf_stem_name = Path(pdf_file_name).stem
+    if is_reserved_folder_name(pdf_stem_name):
+        return "".join(["_", pdf_stem_name])
+    return pdf_stem_name
+
+
+def submit_pdf(
+    scheduler: Scheduler, options: Options, pdf_file_name: str
+) -> concurrent.futures.Future:
+    input_path = os.path.join(options.input_root_path, pdf_file_name)
+    output_path = os.path.join(options.output_root_path, find_output_folder_name(pdf_file_name))
+
+    # folders with a build manifest are brought up to date page by page,
+    # older folders without one are left alone as before
+    output_path_exists = os.path.exists(output_path)
+    if (
+        output_path_exists
+        and options.ignore_existing_directories
+        and not BuildManifest.exists(output_path)
+    ):
+        print("".join(["Ignoring ", pdf_file_name]))
+        return None
+
+    print("".join(["Extracting pages from ", pdf_file_name]))
+    if not output_path_exists:
+        os.makedirs(output_path)
+    extractor = Extractor(scheduler)
+    return scheduler.submit_publication(extractor.extract, options, input_path, output_path)
+
+
+class WorkQueue:
+    # the PDFs waiting to be worked on, kept on disk so anything queued or
+    # in flight when watching stops is picked up again next time
+    file_name = "queue.json"
+
+    def __init__(self, output_root_path: str) -> None:
+        self.file_path = os.path.join(output_root_path, WorkQueue.file_name)
+        self.entries = list[dict]()
+        self.load()
+
+    def load(self) -> None:
+        if not os.path.exists(self.file_path):
+            return
+        with open(self.file_path, "r") as queue_file:
+            try:
+                self.entries = json.load(queue_file)["pdfs"]
+            except (ValueError, KeyError):
+                return
+
+    def save(self) -> None:
+        temporary_file_path = "".join([self.file_path, ".tmp"])
+        with open(temporary_file_path, "w") as queue_file:
+            json.dump({"pdfs": self.entries}, queue_file, indent=2)
+        os.replace(temporary_file_path, self.file_path)
+
+    def add(self, pdf_file_name: str, signature: list[int]) -> None:
+        # a PDF that changes again while queued just has its entry updated
+        self.entries = [entry for entry in self.entries if entry["file"] != pdf_file_name]
+        self.entries.append({"file": pdf_file_name, "signature": signature})
+        self.save()
+
+    def remove(self, pdf_file_name: str, signature: list[int]) -> None:
+        # left queued if the PDF has changed since this version was started
+        self.entries = [
+            entry
+            for entry in self.entries
+            if entry["file"] != pdf_file_name or entry["signature"] != signature
+        ]
+        self.save()
+
+    def find_next(self, excluded_file_names) -> dict:
+        for entry in self.entries:
+            if entry["file"] not in excluded_file_names:
+                return entry
+        return None
+
+
+class Watcher:
+    # how many finished publications the run report keeps in full
+    report_publication_count = 100
+
+    def __init__(self, options: Options, scheduler: Scheduler) -> None:
+        self.options = options
+        self.scheduler = scheduler
+        self.work_queue = WorkQueue(options.output_root_path)
+        # the size and modification time of each PDF at the previous look
+        self.signature_by_file_name = dict[str, list[int]]()
+        self.queued_signature_by_file_name = dict[str, list[int]]()
+        self.started_by_file_name = dict[str, list]()
+        self.failed_pdf_file_names = list[str]()
+        self.seed_signatures()
+        for entry in self.work_queue.entries:
+            self.queued_signature_by_file_name[entry["file"]] = entry["signature"]
+
+    def seed_signatures(self) -> None:
+        # PDFs whose output is already up to date count as seen and done, so
+        # starting the watch again doesn't queue the whole library
+        for pdf_file_name in find_pdf_file_names(self.options.input_root_path):
+            signature = self.find_signature(pdf_file_name)
+            if signature is not None and self.is_up_to_date(pdf_file_name, signature):
+                self.signature_by_file_name[pdf_file_name] = signature
+                self.queued_signature_by_file_name[pdf_file_name] = signature
+
+    def is_up_to_date(self, pdf_file_name: str, signature: list[int]) -> bool:
+        output_folder_path = os.path.join(
+            self.options.output_root_path, find_output_folder_name(pdf_file_name)
+        )
+        if not BuildManifest.exists(output_folder_path):
+            # older folders without a manifest are left alone anyway
+            return os.path.exists(output_folder_path) and self.options.ignore_existing_directories
+        manifest = BuildManifest(output_folder_path)
+        manifest.load()
+        if [manifest.pdf_size, manifest.pdf_modified_time] != signature:
+            return False
+        if manifest.options_signature != BuildManifest.signature_of(self.options):
+            return False
+        if manifest.finalised != self.scheduler.finaliser.signature():
+            return False
+        stage_names = ["publication"]
+        if self.options.generate_meta_from_isbn:
+            stage_names.append("meta_from_isbn")
+        if self.scheduler.library_search is not None:
+            stage_names.append("library_search")
+        for stage_name in stage_names:
+            if not manifest.is_stage_complete(stage_name):
+                return False
+        return True
+
+    def find_signature(self, pdf_file_name: str) -> list[int]:
+        try:
+            pdf_stat = os.stat(os.path.join(self.options.input_root_path, pdf_file_name))
+        except OSError:
             return None
+        return [pdf_stat.st_size, pdf_stat.st_mtime_ns]
 
-        first_item = lookup_response["items"][0]
-        volume_info = first_item["volumeInfo"]
-        meta = Meta()
-        meta.isbn = isbn
-        meta.authors = volume_info["authors"]
-        meta.title = volume_info["title"]
-        meta.thumbnail_url = volume_info["imageLinks"]["thumbnail"]
-        return meta
+    def poll(self) -> None:
+        for pdf_file_name in find_pdf_file_names(self.options.input_root_path):
+            signature = self.find_signature(pdf_file_name)
+            if signature is None:
+                continue
+            previous_signature = self.signature_by_file_name.get(pdf_file_name)
+            self.signature_by_file_name[pdf_file_name] = signature
+            # a PDF still being copied in keeps changing, so it's only
+            # queued once it has stayed the same for a whole interval
+            if signature != previous_signature:
+                continue
+            if self.queued_signature_by_file_name.get(pdf_file_name) == signature:
+                continue
+            print("".join(["Queueing ", pdf_file_name]))
+            self.queued_signature_by_file_name[pdf_file_name] = signature
+            self.work_queue.add(pdf_file_name, signature)
+
+    def start_queued(self) -> None:
+        # no more than --publications at a time, the rest wait in the queue
+        while len(self.started_by_file_name) < self.options.publication_limit:
+            entry = self.work_queue.find_next(self.started_by_file_name.keys())
+            if entry is None:
+                return
+            publication_future = None
+            if self.find_signature(entry["file"]) is not None:
+                publication_future = submit_pdf(self.scheduler, self.options, entry["file"])
+            if publication_future is None:
+                self.work_queue.remove(entry["file"], entry["signature"])
+                continue
+            self.started_by_file_name[entry["file"]] = [publication_future, entry["signature"]]
+
+    def finish_completed(self) -> bool:
+        has_finished = False
+        for pdf_file_name, started in list(self.started_by_file_name.items()):
+            publication_future, signature = started
+            if not publication_future.done():
+                continue
+            del self.started_by_file_name[pdf_file_name]
+            # a PDF that fails is reported and left until it changes, rather
+            # than stopping everything else being watched
+            publication_exception = publication_future.exception()
+            if publication_exception is not None:
+                print("".join(["Unable to extract ", pdf_file_name, ": ", str(publication_exception)]))
+                if pdf_file_name not in self.failed_pdf_file_names:
+                    self.failed_pdf_file_names.append(pdf_file_name)
+            self.work_queue.remove(pdf_file_name, signature)
+            has_finished = True
+        return has_finished
+
+    def run(self) -> None:
+        print("".join(["Watching ", self.options.input_root_path, " for new PDFs"]))
+        try:
+            while True:
+                self.poll()
+                self.start_queued()
+                publication_futures = [started[0] for started in self.started_by_file_name.values()]
+                if len(publication_futures) > 0:
+                    concurrent.futures.wait(
+                        publication_futures,
+                        timeout=self.options.watch_interval,
+                        return_when=concurrent.futures.FIRST_COMPLETED,
+                    )
+                else:
+                    time.sleep(self.options.watch_interval)
+                self.finish_completed()
+                self.scheduler.collect_metadata()
+                self.scheduler.run_report.retire_publications(Watcher.report_publication_count)
+                # also picks up meta data that has arrived in the meantime
+                self.scheduler.publish_library()
+        except KeyboardInterrupt:
+            # nothing queued is started after this, but the PDFs already being
+            # worked on are finished rather than left half done
+            if len(self.started_by_file_name) > 0:
+                print(
+                    "".join(
+                        [
+                            "Stopping once the ",
+                            str(len(self.started_by_file_name)),
+                            " PDFs in progress have finished, anything still queued is picked up next time",
+                        ]
+                    )
+                )
+            else:
+                print("Stopping, anything still queued is picked up next time")
+            publication_futures = [started[0] for started in self.started_by_file_name.values()]
+            concurrent.futures.wait(publication_futures)
+            self.finish_completed()
 
 
 if __name__ == "__main__":
     
     input_folder = ''
     output_folder = ''
+    options = Options()
+    usage = 'generate.py -i <inputfolder> -o <outputfolder> [-j <jobs>] [-p <publications>] [--stream] [--raw-page-limit <pages>] [--imaging <auto|pillow|convert>] [--ocr <auto|tesserocr|command>] [--language <lang>] [--ocr-all] [--text-layer-threshold <characters>] [--ocr-cache <folder>] [--ocr-cache-size <megabytes>] [--no-ocr-cache] [--no-library-search] [--catalogue-chunk-size <publications>] [--image-formats <jpg,webp,avif>] [--no-image-tiers] [--isbn-lookup-url <url>] [--isbn-lookups <count>] [--isbn-timeout <seconds>] [--no-isbn-cache] [--report <file>] [--profile <file>] [--ocr-resolution <dpi>] [--image-resolution <dpi>] [--no-adaptive-ocr] [--ocr-preprocess <none|grayscale|binarise>] [--no-minify] [--no-compress] [--hash-asset-names] [--watch] [--watch-interval <seconds>]'
     try:
-        opts, args = getopt.getopt(sys.argv[1:],"hi:o:",["input=","output="])
+        opts, args = getopt.getopt(sys.argv[1:],"hi:o:j:p:",["input=","output=","jobs=","publications=","stream","raw-page-limit=","imaging=","ocr=","language=","ocr-all","text-layer-threshold=","ocr-cache=","ocr-cache-size=","no-ocr-cache","no-library-search","catalogue-chunk-size=","image-formats=","no-image-tiers","isbn-lookup-url=","isbn-lookups=","isbn-timeout=","no-isbn-cache","report=","profile=","ocr-resolution=","image-resolution=","no-adaptive-ocr","ocr-preprocess=","no-minify","no-compress","hash-asset-names","watch","watch-interval="])
     except getopt.GetoptError:
-        print ('test.py -i <inputfolder> -o <outputfolder>')
+        print (usage)
+        sys.exit(2)
+    def choose(choice: str, choices: list[str]) -> str:
+        if choice not in choices:
+            raise ValueError("".join([choice, " isn't one of ", "|".join(choices)]))
+        return choice
+
+    # a mistyped value is an error, rather than quietly meaning something else
+    try:
+        for opt, arg in opts:
+            if opt == '-h':
+                print (usage)
+                sys.exit()
+            elif opt in ("-i", "--input"):
+                input_folder = arg
+            elif opt in ("-o", "--output"):
+                output_folder = arg
+            elif opt in ("-j", "--jobs"):
+                options.job_count = max(1, int(arg))
+            elif opt in ("-p", "--publications"):
+                options.publication_limit = max(1, int(arg))
+            elif opt == "--stream":
+                options.stream_pages = True
+            elif opt == "--raw-page-limit":
+                options.raw_page_limit = max(1, int(arg))
+            elif opt == "--imaging":
+                options.imaging_backend = choose(arg, Options.imaging_backends)
+            elif opt == "--ocr":
+                options.ocr_backend = choose(arg, Options.ocr_backends)
+            elif opt == "--language":
+                options.ocr_language = arg
+            elif opt == "--ocr-all":
+                options.use_text_layer = False
+            elif opt == "--text-layer-threshold":
+                options.text_layer_threshold = int(arg)
+            elif opt == "--ocr-cache":
+                options.ocr_cache_path = arg
+            elif opt == "--ocr-cache-size":
+                options.ocr_cache_size_limit = int(arg) * 1024 * 1024
+            elif opt == "--no-ocr-cache":
+                options.use_ocr_cache = False
+            elif opt == "--no-library-search":
+                options.generate_library_search = False
+            elif opt == "--catalogue-chunk-size":
+                options.catalogue_chunk_size = max(1, int(arg))
+            elif opt == "--image-formats":
+                options.image_formats = list[str](["jpg"])
+                for image_format in arg.split(","):
+                    choose(image_format, Options.image_format_names)
+                    if image_format not in options.image_formats:
+                        options.image_formats.append(image_format)
+            elif opt == "--no-image-tiers":
+                options.image_tier_widths = dict[str, int]()
+            elif opt == "--isbn-lookup-url":
+                options.isbn_lookup_url = arg
+            elif opt == "--isbn-lookups":
+                options.isbn_lookup_limit = max(1, int(arg))
+            elif opt == "--isbn-timeout":
+                options.isbn_lookup_timeout = float(arg)
+            elif opt == "--no-isbn-cache":
+                options.use_isbn_cache = False
+            elif opt == "--report":
+                options.report_path = arg
+            elif opt == "--profile":
+                options.profile_path = arg
+            elif opt == "--ocr-resolution":
+                options.page_resolution = max(1, int(arg))
+            elif opt == "--image-resolution":
+                options.image_resolution = max(1, int(arg))
+            elif opt == "--no-adaptive-ocr":
+                options.adaptive_ocr = False
+            elif opt == "--ocr-preprocess":
+                options.ocr_preprocess = choose(arg, Options.ocr_preprocess_modes)
+            elif opt == "--no-minify":
+                options.minify_output = False
+            elif opt == "--no-compress":
+                options.compress_output = False
+            elif opt == "--hash-asset-names":
+                options.hash_asset_names = True
+            elif opt == "--watch":
+                options.watch = True
+            elif opt == "--watch-interval":
+                options.watch_interval = max(0.1, float(arg))
+    except ValueError as option_error:
+        print("".join(["Invalid value for ", opt, ": ", str(option_error)]))
+        print (usage)
         sys.exit(2)
-    for opt, arg in opts:
-        if opt == '-h':
-            print ('generate.py -i <inputfolder> -o <outputfolder>')
-            sys.exit()
-        elif opt in ("-i", "--input"):
-            input_folder = arg
-        elif opt in ("-o", "--output"):
-            output_folder = arg
     print ('Reading from ' + input_folder)
     print ('Generating to ' + output_folder)
 
-    options = Options()
     options.input_root_path = input_folder
     options.output_root_path = output_folder
 
-    pdf_stem_names = list[str]()
-    for root, dirs, file_names in os.walk(options.input_root_path):
-        for file_name in file_names:
-            if file_name.endswith(".pdf"):
-                stem_name = Path(file_name).stem
-                pdf_stem_names.append(stem_name)
-
-    for pdf_stem_name in pdf_stem_names:
-        pdf_file_name = "".join([pdf_stem_name, ".pdf"])
-        input_path = os.path.join(options.input_root_path, pdf_file_name)
-        output_path = os.path.join(options.output_root_path, pdf_stem_name)
-
-        process_pdf = True
-        output_path_exists = os.path.exists(output_path)
-        if output_path_exists and options.ignore_existing_directories:
-            process_pdf = False
-
-        if process_pdf:
-            print("".join(["Extracting pages from ", pdf_file_name]))
-            if not output_path_exists:
-                os.makedirs(output_path)
-            extractor = Extractor()
-            extractor.extract(options, input_path, output_path)
+    scheduler = Scheduler(options)
+    failed_pdf_file_names = list[str]()
+    try:
+        if options.watch:
+            os.makedirs(options.output_root_path, exist_ok=True)
+            watcher = Watcher(options, scheduler)
+            failed_pdf_file_names = watcher.failed_pdf_file_names
+            watcher.run()
         else:
-            print("".join(["Ignoring ", pdf_file_name]))
+            publication_future_by_file_name = dict[str, concurrent.futures.Future]()
+            for pdf_file_name in find_pdf_file_names(options.input_root_path):
+                publication_future = submit_pdf(scheduler, options, pdf_file_name)
+                if publication_future is not None:
+                    publication_future_by_file_name[pdf_file_name] = publication_future
+            # a PDF that fails is reported and the rest of the library carries on
+            for pdf_file_name, publication_future in publication_future_by_file_name.items():
+                publication_exception = publication_future.exception()
+                if publication_exception is not None:
+                    print("".join(["Unable to extract ", pdf_file_name, ": ", str(publication_exception)]))
+                    failed_pdf_file_names.append(pdf_file_name)
+    finally:
+        scheduler.shutdown()
+
+    if scheduler.ocr_cache is not None:
+        scheduler.ocr_cache.report()
+    if scheduler.isbn_lookup is not None:
+        scheduler.isbn_lookup.report()
+
+    report_path = options.report_path
+    if report_path is None:
+        report_path = os.path.join(options.output_root_path, RunReport.file_name)
+    scheduler.run_report.save(report_path)
+    scheduler.run_report.summarise()
+
+    if len(failed_pdf_file_names) > 0:
+        print("".join(["Unable to extract ", str(len(failed_pdf_file_names)), " PDFs: ", ", ".join(failed_pdf_file_names)]))
+        sys.exit(1)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# generate.py is a script rather than a package, so the tests import it
+# straight from the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+# the benchmark helpers double as references and sample data for the tests
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "bench"))
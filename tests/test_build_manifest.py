@@ -0,0 +1,102 @@
+import os
+
+import pytest
+
+from generate import BuildManifest, Options
+
+page_file_names = [
+    "page0000.png",
+    "page0000.txt",
+    "page0000.jpg",
+    "page0000.thumbnail.webp",
+    "page0000.screen.3f2a9c1b7d4e.avif",
+    "page-01.png",
+]
+kept_file_names = ["structure.json", "search.json", "pages.txt"]
+meta_file_names = ["meta.json", "meta.json.gz", "meta.json.br"]
+
+
+@pytest.fixture
+def publication(tmp_path):
+    # a finished build: a pdf, its output folder and a manifest that has
+    # every stage complete
+    pdf_file_path = str(tmp_path / "book.pdf")
+    with open(pdf_file_path, "wb") as pdf_file:
+        pdf_file.write(b"%PDF-1.4 first edition")
+    output_folder_path = str(tmp_path / "book")
+    os.makedirs(output_folder_path)
+    for file_name in page_file_names + kept_file_names + meta_file_names:
+        with open(os.path.join(output_folder_path, file_name), "w") as output_file:
+            output_file.write("contents")
+
+    manifest = BuildManifest(output_folder_path)
+    manifest.refresh(Options(), pdf_file_path)
+    manifest.complete_page("page0000", ["txt", "jpg"], list[dict]())
+    manifest.isbns = ["9780306406157"]
+    manifest.finalised = {"minify": True, "compress": ["gz"]}
+    manifest.complete_stage("publication")
+    return pdf_file_path, output_folder_path
+
+
+def refresh(output_folder_path: str, options: Options, pdf_file_path: str) -> BuildManifest:
+    manifest = BuildManifest(output_folder_path)
+    manifest.load()
+    manifest.refresh(options, pdf_file_path)
+    return manifest
+
+
+def existing_file_names(output_folder_path: str) -> set[str]:
+    return set[str](os.listdir(output_folder_path)) - set[str]([BuildManifest.file_name])
+
+
+def assert_reset(manifest: BuildManifest) -> None:
+    assert manifest.completed_stages == list[str]()
+    assert manifest.artefacts_by_page_stem_name == dict[str, list[str]]()
+    assert manifest.isbns == list[str]()
+    assert manifest.finalised == dict()
+
+
+def test_unchanged_build_is_kept(publication):
+    pdf_file_path, output_folder_path = publication
+    manifest = refresh(output_folder_path, Options(), pdf_file_path)
+
+    assert manifest.is_stage_complete("publication")
+    assert manifest.artefacts_by_page_stem_name == {"page0000": ["txt", "jpg"]}
+    assert manifest.isbns == ["9780306406157"]
+    assert manifest.finalised == {"minify": True, "compress": ["gz"]}
+    assert existing_file_names(output_folder_path) == set[str](
+        page_file_names + kept_file_names + meta_file_names
+    )
+
+
+def test_touched_pdf_with_the_same_contents_is_kept(publication):
+    pdf_file_path, output_folder_path = publication
+    os.utime(pdf_file_path, (1000, 1000))
+    manifest = refresh(output_folder_path, Options(), pdf_file_path)
+
+    assert manifest.is_stage_complete("publication")
+    assert manifest.pdf_modified_time == 1000 * 1000 * 1000 * 1000
+    assert refresh(output_folder_path, Options(), pdf_file_path).is_stage_complete("publication")
+
+
+def test_changed_options_rebuild_the_pages(publication):
+    pdf_file_path, output_folder_path = publication
+    options = Options()
+    options.page_resolution = 200
+    manifest = refresh(output_folder_path, options, pdf_file_path)
+
+    assert_reset(manifest)
+    assert manifest.options_signature["page_resolution"] == 200
+    # the book is the same, so the meta data found for it still applies
+    assert existing_file_names(output_folder_path) == set[str](kept_file_names + meta_file_names)
+
+
+def test_changed_pdf_rebuilds_everything(publication):
+    pdf_file_path, output_folder_path = publication
+    with open(pdf_file_path, "wb") as pdf_file:
+        pdf_file.write(b"%PDF-1.4 second edition")
+    manifest = refresh(output_folder_path, Options(), pdf_file_path)
+
+    assert_reset(manifest)
+    assert existing_file_names(output_folder_path) == set[str](kept_file_names)
+    assert refresh(output_folder_path, Options(), pdf_file_path).pdf_hash == manifest.pdf_hash
@@ -0,0 +1,193 @@
+import concurrent.futures
+import http.server
+import json
+import os
+import threading
+
+import pytest
+
+from generate import BuildManifest, Extractor, IsbnLookup, Meta, Options, Scheduler
+
+
+class StubBooksHandler(http.server.BaseHTTPRequestHandler):
+    # isbn -> the statuses to answer with in turn, the last one repeating
+    statuses_by_isbn = dict()
+    request_counts_by_isbn = dict()
+
+    def do_GET(self):
+        isbn = self.path.rsplit("=", 1)[-1]
+        request_count = StubBooksHandler.request_counts_by_isbn.get(isbn, 0)
+        StubBooksHandler.request_counts_by_isbn[isbn] = request_count + 1
+        statuses = StubBooksHandler.statuses_by_isbn.get(isbn, [200])
+        status = statuses[min(request_count, len(statuses) - 1)]
+        if status != 200:
+            self.send_error(status)
+            return
+        if isbn == "9780306406157":
+            body = {
+                "totalItems": 1,
+                "items": [
+                    {
+                        "volumeInfo": {
+                            "title": 'The "Stub" Book \\ Volume 1',
+                            "authors": ["A. Writer"],
+                            "imageLinks": {"thumbnail": "http://books.example/t.jpg"},
+                        }
+                    }
+                ],
+            }
+        else:
+            body = {"totalItems": 0}
+        body_data = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body_data)))
+        self.end_headers()
+        self.wfile.write(body_data)
+
+    def log_message(self, format, *arguments):
+        pass
+
+
+@pytest.fixture
+def books_server():
+    StubBooksHandler.statuses_by_isbn = dict()
+    StubBooksHandler.request_counts_by_isbn = dict()
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StubBooksHandler)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+    yield "".join(["http://127.0.0.1:", str(server.server_port), "/volumes?q=isbn="])
+    server.shutdown()
+    server.server_close()
+
+
+def create_options(tmp_path, lookup_url: str) -> Options:
+    options = Options()
+    options.isbn_lookup_url = lookup_url
+    options.isbn_lookup_timeout = 5
+    options.isbn_lookup_retry_count = 1
+    options.isbn_cache_path = str(tmp_path / "isbn.json")
+    return options
+
+
+def test_hit_is_cached_on_disk(tmp_path, books_server):
+    options = create_options(tmp_path, books_server)
+    isbn_lookup = IsbnLookup(options)
+    meta = isbn_lookup.submit("9780306406157").result()
+    isbn_lookup.shutdown()
+    assert meta.title == 'The "Stub" Book \\ Volume 1'
+    assert meta.authors == ["A. Writer"]
+
+    # a fresh lookup answers from the cache file without asking again
+    isbn_lookup = IsbnLookup(options)
+    meta = isbn_lookup.submit("9780306406157").result()
+    isbn_lookup.shutdown()
+    assert meta.title == 'The "Stub" Book \\ Volume 1'
+    assert StubBooksHandler.request_counts_by_isbn["9780306406157"] == 1
+    assert isbn_lookup.hit_count == 1
+
+
+def test_miss_tries_the_isbn_10_and_is_negatively_cached(tmp_path, books_server):
+    options = create_options(tmp_path, books_server)
+    isbn_lookup = IsbnLookup(options)
+    assert isbn_lookup.submit("9781111111111").result() is None
+    isbn_lookup.shutdown()
+    assert StubBooksHandler.request_counts_by_isbn == {"9781111111111": 1, "9781111111": 1}
+
+    isbn_lookup = IsbnLookup(options)
+    assert isbn_lookup.submit("9781111111111").result() is None
+    isbn_lookup.shutdown()
+    assert StubBooksHandler.request_counts_by_isbn["9781111111111"] == 1
+
+
+def test_negative_cache_expires(tmp_path, books_server):
+    options = create_options(tmp_path, books_server)
+    options.isbn_negative_cache_age = 0
+    isbn_lookup = IsbnLookup(options)
+    assert isbn_lookup.submit("1111111111").result() is None
+    isbn_lookup.shutdown()
+
+    isbn_lookup = IsbnLookup(options)
+    assert isbn_lookup.submit("1111111111").result() is None
+    isbn_lookup.shutdown()
+    assert StubBooksHandler.request_counts_by_isbn["1111111111"] == 2
+
+
+def test_server_error_is_retried(tmp_path, books_server):
+    StubBooksHandler.statuses_by_isbn["9780306406157"] = [503, 200]
+    options = create_options(tmp_path, books_server)
+    isbn_lookup = IsbnLookup(options)
+    meta = isbn_lookup.submit("9780306406157").result()
+    isbn_lookup.shutdown()
+    assert meta.title == 'The "Stub" Book \\ Volume 1'
+    assert StubBooksHandler.request_counts_by_isbn["9780306406157"] == 2
+
+
+def test_failure_is_raised_and_not_cached(tmp_path, books_server):
+    StubBooksHandler.statuses_by_isbn["9780306406157"] = [500]
+    options = create_options(tmp_path, books_server)
+    isbn_lookup = IsbnLookup(options)
+    with pytest.raises(OSError):
+        isbn_lookup.submit("9780306406157").result()
+    isbn_lookup.shutdown()
+    assert StubBooksHandler.request_counts_by_isbn["9780306406157"] == 2
+    assert not os.path.exists(options.isbn_cache_path)
+
+
+def test_failed_isbn_is_looked_up_again(tmp_path, books_server):
+    StubBooksHandler.statuses_by_isbn["9780306406157"] = [500, 500, 200]
+    options = create_options(tmp_path, books_server)
+    isbn_lookup = IsbnLookup(options)
+    with pytest.raises(OSError):
+        isbn_lookup.submit("9780306406157").result()
+
+    meta = isbn_lookup.submit("9780306406157").result()
+    isbn_lookup.shutdown()
+    assert meta.title == 'The "Stub" Book \\ Volume 1'
+    assert StubBooksHandler.request_counts_by_isbn["9780306406157"] == 3
+
+
+def test_finished_lookups_are_let_go(tmp_path, books_server):
+    options = create_options(tmp_path, books_server)
+    isbn_lookup = IsbnLookup(options)
+    assert isbn_lookup.submit("9780306406157").result().authors == ["A. Writer"]
+    assert isbn_lookup.futures_by_isbn == dict()
+
+    # the same isbn in a later book is answered from the cache
+    assert isbn_lookup.submit("9780306406157").result().authors == ["A. Writer"]
+    isbn_lookup.shutdown()
+    assert StubBooksHandler.request_counts_by_isbn["9780306406157"] == 1
+    assert isbn_lookup.hit_count == 1
+
+
+def test_meta_json_escapes_quotes(tmp_path):
+    options = Options()
+    options.output_root_path = str(tmp_path)
+    options.ocr_backend = "command"
+    options.use_ocr_cache = False
+    options.generate_library_search = False
+    options.generate_structure = False
+    options.generate_meta_from_isbn = False
+    options.preserve_existing_meta = False
+    output_folder_path = tmp_path / "book"
+    output_folder_path.mkdir()
+
+    meta = Meta()
+    meta.isbn = "9780306406157"
+    meta.title = 'A "Quoted" \\ Title'
+    meta.authors = ['O"Brien']
+    meta_future = concurrent.futures.Future()
+    meta_future.set_result(meta)
+
+    scheduler = Scheduler(options)
+    try:
+        extractor = Extractor(scheduler)
+        extractor.manifest = BuildManifest(str(output_folder_path))
+        extractor.generate_meta_from_isbn(options, str(output_folder_path), [meta_future])
+    finally:
+        scheduler.shutdown()
+
+    with open(output_folder_path / "meta.json", "r") as meta_file:
+        meta_contents = json.load(meta_file)
+    assert meta_contents["title"] == 'A "Quoted" \\ Title'
+    assert meta_contents["authors"] == ['O"Brien']
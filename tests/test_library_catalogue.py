@@ -0,0 +1,150 @@
+import json
+import os
+import shutil
+
+from generate import LibraryCatalogue
+from synthetic import write_library
+
+
+def write_meta(output_root_path: str, publication_folder: str, title: str) -> None:
+    meta_file_path = os.path.join(output_root_path, publication_folder, "meta.json")
+    with open(meta_file_path, "w") as meta_file:
+        json.dump({"title": title, "authors": ["Someone"]}, meta_file)
+
+
+def read_json(file_path: str):
+    with open(file_path, "r") as json_file:
+        return json.load(json_file)
+
+
+def read_catalogue(output_root_path: str) -> tuple[dict, list[list[str]]]:
+    folder_path = os.path.join(output_root_path, LibraryCatalogue.folder_name)
+    index = read_json(os.path.join(folder_path, LibraryCatalogue.index_file_name))
+    folders_by_chunk = list[list[str]]()
+    for chunk in index["chunks"]:
+        publications = read_json(os.path.join(folder_path, chunk["file"]))["publications"]
+        folders_by_chunk.append([publication["folder"] for publication in publications])
+    return index, folders_by_chunk
+
+
+def chunk_inode(output_root_path: str, chunk_file_name: str) -> int:
+    chunk_file_path = os.path.join(output_root_path, LibraryCatalogue.folder_name, chunk_file_name)
+    return os.stat(chunk_file_path).st_ino
+
+
+def make_publication_folders(output_root_path: str, publication_folders: list[str]) -> None:
+    for publication_folder in publication_folders:
+        os.makedirs(os.path.join(output_root_path, publication_folder), exist_ok=True)
+
+
+def read_structure_folders(output_root_path: str) -> list[str]:
+    structure = read_json(os.path.join(output_root_path, LibraryCatalogue.file_name))
+    return [publication["folder"] for publication in structure["publications"]]
+
+
+def test_structure_lists_every_publication_folder(tmp_path):
+    output_root_path = str(tmp_path)
+    make_publication_folders(output_root_path, ["second", "first", ".hidden", "search"])
+
+    LibraryCatalogue(output_root_path).save()
+
+    assert read_structure_folders(output_root_path) == ["first", "second"]
+
+
+def test_added_and_removed_folders_are_noticed(tmp_path):
+    output_root_path = str(tmp_path)
+    make_publication_folders(output_root_path, ["first", "second"])
+    LibraryCatalogue(output_root_path).save()
+
+    shutil.rmtree(os.path.join(output_root_path, "first"))
+    make_publication_folders(output_root_path, ["third"])
+    LibraryCatalogue(output_root_path).save()
+
+    assert read_structure_folders(output_root_path) == ["second", "third"]
+
+
+def test_unchanged_structure_is_not_rewritten(tmp_path):
+    output_root_path = str(tmp_path)
+    make_publication_folders(output_root_path, ["first", "second"])
+    LibraryCatalogue(output_root_path).save()
+    structure_file_path = os.path.join(output_root_path, LibraryCatalogue.file_name)
+    structure_inode = os.stat(structure_file_path).st_ino
+
+    LibraryCatalogue(output_root_path).save()
+
+    assert os.stat(structure_file_path).st_ino == structure_inode
+
+
+def test_chunks_are_sorted_by_title(tmp_path):
+    output_root_path = str(tmp_path)
+    write_library(output_root_path, 5)
+    write_meta(output_root_path, "publication00003", "Apples")
+    write_meta(output_root_path, "publication00001", "bananas")
+
+    LibraryCatalogue(output_root_path, chunk_size=2).save()
+
+    index, folders_by_chunk = read_catalogue(output_root_path)
+    # books without a title are listed under their folder name
+    assert folders_by_chunk == [
+        ["publication00003", "publication00001"],
+        ["publication00000", "publication00002"],
+        ["publication00004"],
+    ]
+    assert index["publication_count"] == 5
+    assert index["chunk_size"] == 2
+    assert [chunk["file"] for chunk in index["chunks"]] == ["0000.json", "0001.json", "0002.json"]
+    assert [chunk["count"] for chunk in index["chunks"]] == [2, 2, 1]
+    assert index["chunks"][0]["first"] == "apples"
+    assert index["chunks"][0]["last"] == "bananas"
+    assert index["chunks"][2]["last"] == "publication00004"
+
+    chunk = read_json(os.path.join(output_root_path, "catalogue", "0000.json"))
+    assert chunk["publications"][0] == {
+        "authors": ["Someone"],
+        "cover": "page0000.jpg",
+        "folder": "publication00003",
+        "pages": 1,
+        "title": "Apples",
+    }
+
+
+def test_only_changed_chunks_are_rewritten(tmp_path):
+    output_root_path = str(tmp_path)
+    write_library(output_root_path, 4)
+    LibraryCatalogue(output_root_path, chunk_size=2).save()
+    first_chunk_inode = chunk_inode(output_root_path, "0000.json")
+    second_chunk_inode = chunk_inode(output_root_path, "0001.json")
+
+    write_library(output_root_path, 5)
+    LibraryCatalogue(output_root_path, chunk_size=2).save()
+
+    _, folders_by_chunk = read_catalogue(output_root_path)
+    assert folders_by_chunk[-1] == ["publication00004"]
+    assert chunk_inode(output_root_path, "0000.json") == first_chunk_inode
+    assert chunk_inode(output_root_path, "0001.json") == second_chunk_inode
+
+    # a book that has had its meta data found moves to where its title sorts
+    write_meta(output_root_path, "publication00004", "Aardvarks")
+    catalogue = LibraryCatalogue(output_root_path, chunk_size=2)
+    catalogue.add_publication("publication00004")
+    catalogue.save()
+
+    _, folders_by_chunk = read_catalogue(output_root_path)
+    assert folders_by_chunk[0] == ["publication00004", "publication00000"]
+    assert chunk_inode(output_root_path, "0000.json") != first_chunk_inode
+
+
+def test_removed_folders_are_dropped(tmp_path):
+    output_root_path = str(tmp_path)
+    write_library(output_root_path, 3)
+    LibraryCatalogue(output_root_path, chunk_size=2).save()
+
+    shutil.rmtree(os.path.join(output_root_path, "publication00001"))
+    shutil.rmtree(os.path.join(output_root_path, "publication00002"))
+    LibraryCatalogue(output_root_path, chunk_size=2).save()
+
+    index, folders_by_chunk = read_catalogue(output_root_path)
+    assert index["publication_count"] == 1
+    assert folders_by_chunk == [["publication00000"]]
+    assert not os.path.exists(os.path.join(output_root_path, "catalogue", "0001.json"))
+
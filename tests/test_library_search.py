@@ -0,0 +1,111 @@
+import json
+import os
+import shutil
+
+from generate import BuildManifest, LibrarySearchIndex
+
+
+def write_publication(output_root_path: str, publication_folder: str, terms: dict) -> str:
+    output_folder_path = os.path.join(output_root_path, publication_folder)
+    os.makedirs(output_folder_path, exist_ok=True)
+    search = {"pages": ["page0000"], "terms": terms}
+    with open(os.path.join(output_folder_path, "search.json"), "w") as search_file:
+        json.dump(search, search_file)
+    return output_folder_path
+
+
+def add_publication(
+    index: LibrarySearchIndex, output_root_path: str, publication_folder: str
+) -> BuildManifest:
+    output_folder_path = os.path.join(output_root_path, publication_folder)
+    manifest = BuildManifest(output_folder_path)
+    index.add_publication(publication_folder, output_folder_path, manifest)
+    return manifest
+
+
+def read_index(output_root_path: str) -> tuple[dict, dict[str, dict]]:
+    folder_path = os.path.join(output_root_path, LibrarySearchIndex.folder_name)
+    shards = dict[str, dict]()
+    for file_name in os.listdir(folder_path):
+        with open(os.path.join(folder_path, file_name), "r") as json_file:
+            contents = json.load(json_file)
+        if file_name == LibrarySearchIndex.publications_file_name:
+            publications = contents
+        else:
+            shards[file_name] = contents
+    return publications, shards
+
+
+def test_shard_names_are_file_name_safe():
+    assert LibrarySearchIndex.shard_name_for("apple") == "ap"
+    assert LibrarySearchIndex.shard_name_for("a") == "a"
+    assert LibrarySearchIndex.shard_name_for("über") == "_fcb"
+    assert LibrarySearchIndex.shard_name_for("$5") == "_245"
+
+
+def test_add_sums_page_counts_into_shards(tmp_path):
+    output_root_path = str(tmp_path)
+    write_publication(output_root_path, "first", {"apple": [0, 2, 1, 3], "banana": [0, 1]})
+    write_publication(output_root_path, "second", {"apple": [1, 4]})
+
+    index = LibrarySearchIndex(output_root_path)
+    first_manifest = add_publication(index, output_root_path, "first")
+    add_publication(index, output_root_path, "second")
+    assert not first_manifest.is_stage_complete("library_search")
+    index.flush()
+    assert first_manifest.is_stage_complete("library_search")
+
+    publications, shards = read_index(output_root_path)
+    assert publications["next_id"] == 2
+    assert [publication["folder"] for publication in publications["publications"]] == [
+        "first",
+        "second",
+    ]
+    assert shards == {"ap.json": {"apple": [0, 5, 1, 4]}, "ba.json": {"banana": [0, 1]}}
+
+
+def test_readding_replaces_postings_and_keeps_the_id(tmp_path):
+    output_root_path = str(tmp_path)
+    write_publication(output_root_path, "first", {"apple": [0, 2], "banana": [0, 1]})
+    index = LibrarySearchIndex(output_root_path)
+    add_publication(index, output_root_path, "first")
+    index.flush()
+
+    write_publication(output_root_path, "first", {"apple": [0, 7], "cherry": [0, 1]})
+    index = LibrarySearchIndex(output_root_path)
+    add_publication(index, output_root_path, "first")
+    index.flush()
+
+    publications, shards = read_index(output_root_path)
+    assert publications["next_id"] == 1
+    assert publications["publications"][0]["shards"] == ["ap", "ch"]
+    # the banana shard had nothing else in it, so it is gone entirely
+    assert shards == {"ap.json": {"apple": [0, 7]}, "ch.json": {"cherry": [0, 1]}}
+
+
+def test_vanished_folders_are_removed_at_load(tmp_path):
+    output_root_path = str(tmp_path)
+    first_folder_path = write_publication(
+        output_root_path, "first", {"apple": [0, 2], "banana": [0, 1]}
+    )
+    write_publication(output_root_path, "second", {"apple": [0, 3]})
+    index = LibrarySearchIndex(output_root_path)
+    add_publication(index, output_root_path, "first")
+    add_publication(index, output_root_path, "second")
+    index.flush()
+
+    shutil.rmtree(first_folder_path)
+    index = LibrarySearchIndex(output_root_path)
+    index.flush()
+
+    publications, shards = read_index(output_root_path)
+    assert [publication["folder"] for publication in publications["publications"]] == ["second"]
+    assert shards == {"ap.json": {"apple": [1, 3]}}
+
+    # ids are never reused, so a stale link can't point at another book
+    write_publication(output_root_path, "third", {"apple": [0, 1]})
+    index = LibrarySearchIndex(output_root_path)
+    add_publication(index, output_root_path, "third")
+    index.flush()
+    publications, shards = read_index(output_root_path)
+    assert publications["publications"][-1] == {"folder": "third", "id": 2, "shards": ["ap"]}
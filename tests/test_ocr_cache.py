@@ -0,0 +1,63 @@
+import os
+
+from generate import OcrCache, Options
+
+
+def create_cache(cache_folder_path: str, size_limit: int) -> OcrCache:
+    options = Options()
+    options.ocr_cache_path = cache_folder_path
+    options.ocr_cache_size_limit = size_limit
+    return OcrCache(options, "tesseract 5.0.0 eng")
+
+
+def test_misses_then_hits(tmp_path):
+    cache = create_cache(str(tmp_path), 1024)
+    assert cache.find("aa01") is None
+    cache.store("aa01", "page text")
+    assert cache.find("aa01") == "page text"
+    assert os.path.exists(os.path.join(str(tmp_path), "aa", "aa01.txt"))
+    assert (cache.hit_count, cache.miss_count) == (1, 1)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = create_cache(str(tmp_path), 30)
+    cache.store("aa01", "1" * 10)
+    cache.store("bb02", "2" * 10)
+    cache.store("cc03", "3" * 10)
+    # reading the oldest entry makes it the most recently used
+    assert cache.find("aa01") == "1" * 10
+
+    cache.store("dd04", "4" * 10)
+    assert list(cache.size_by_key.keys()) == ["cc03", "aa01", "dd04"]
+    assert cache.total_size == 30
+    assert not os.path.exists(cache.entry_path("bb02"))
+    assert cache.find("bb02") is None
+
+
+def test_an_entry_over_the_limit_is_still_kept(tmp_path):
+    cache = create_cache(str(tmp_path), 30)
+    cache.store("aa01", "1" * 10)
+    cache.store("bb02", "2" * 40)
+    assert list(cache.size_by_key.keys()) == ["bb02"]
+    assert cache.find("bb02") == "2" * 40
+
+
+def test_storing_an_entry_again_replaces_its_size(tmp_path):
+    cache = create_cache(str(tmp_path), 30)
+    cache.store("aa01", "1" * 10)
+    cache.store("aa01", "1" * 20)
+    assert cache.total_size == 20
+
+
+def test_reloaded_cache_keeps_the_usage_order(tmp_path):
+    cache = create_cache(str(tmp_path), 30)
+    for key, modified_time in [("aa01", 3000), ("bb02", 1000), ("cc03", 2000)]:
+        cache.store(key, "x" * 10)
+        os.utime(cache.entry_path(key), (modified_time, modified_time))
+
+    cache = create_cache(str(tmp_path), 30)
+    assert list(cache.size_by_key.keys()) == ["bb02", "cc03", "aa01"]
+    assert cache.total_size == 30
+
+    cache.store("dd04", "x" * 10)
+    assert list(cache.size_by_key.keys()) == ["cc03", "aa01", "dd04"]
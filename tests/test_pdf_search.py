@@ -0,0 +1,63 @@
+import json
+import os
+import random
+
+from generate import Extractor
+
+vocabulary = ["apple", "Pear", "fox,", "ISBN-13:", "978-0-306-40615-7", "$5", "@home.", "Über"]
+
+
+def write_pages(folder_path: str, page_texts: list[str]) -> None:
+    for page_index in range(len(page_texts)):
+        page_txt_file_name = "".join(["page", str(page_index).zfill(4), ".txt"])
+        with open(os.path.join(folder_path, page_txt_file_name), "w") as page_txt_file:
+            page_txt_file.write(page_texts[page_index])
+
+
+def read_search(folder_path: str) -> dict:
+    with open(os.path.join(folder_path, "search.json"), "r") as search_file:
+        return json.load(search_file)
+
+
+def decode_search(search: dict) -> dict[str, dict[str, int]]:
+    # undoes the page deltas, giving page stem -> word -> count
+    count_by_word_by_page_stem_name = dict[str, dict[str, int]]()
+    for page_stem_name in search["pages"]:
+        count_by_word_by_page_stem_name[page_stem_name] = dict[str, int]()
+    for word, postings in search["terms"].items():
+        page_index = 0
+        for posting_index in range(0, len(postings), 2):
+            page_index += postings[posting_index]
+            page_stem_name = search["pages"][page_index]
+            count_by_word_by_page_stem_name[page_stem_name][word] = postings[posting_index + 1]
+    return count_by_word_by_page_stem_name
+
+
+def test_page_deltas_are_relative_to_the_previous_page(tmp_path):
+    write_pages(str(tmp_path), ["apple pear", "pear", "", "apple apple pear"])
+    Extractor().generate_pdf_search(str(tmp_path))
+
+    search = read_search(str(tmp_path))
+    assert search["pages"] == ["page0000", "page0001", "page0002", "page0003"]
+    assert search["terms"] == {"apple": [0, 1, 3, 2], "pear": [0, 1, 1, 1, 2, 1]}
+
+
+def test_first_delta_counts_from_the_first_page(tmp_path):
+    write_pages(str(tmp_path), ["", "", "late"])
+    Extractor().generate_pdf_search(str(tmp_path))
+
+    assert read_search(str(tmp_path))["terms"] == {"late": [2, 1]}
+
+
+def test_search_decodes_to_the_word_frequencies(tmp_path):
+    generator = random.Random(3)
+    page_texts = list[str]()
+    for _ in range(12):
+        word_count = generator.randint(0, 40)
+        page_texts.append(" ".join(generator.choice(vocabulary) for _ in range(word_count)))
+    write_pages(str(tmp_path), page_texts)
+    extractor = Extractor()
+    extractor.generate_pdf_search(str(tmp_path))
+
+    expected = extractor.calculate_word_frequencies_by_page(str(tmp_path))
+    assert decode_search(read_search(str(tmp_path))) == expected
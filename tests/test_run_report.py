@@ -0,0 +1,41 @@
+import pytest
+
+from generate import Options, RunReport, Runner
+
+
+@pytest.fixture
+def run_report():
+    run_report = RunReport(Options())
+    yield run_report
+    run_report.close()
+
+
+def test_subprocesses_are_charged_to_the_running_stage(run_report, tmp_path):
+    run_report.begin_publication("book", str(tmp_path))
+    with run_report.measure("book", "rasterise"):
+        Runner().execute(["true"])
+        Runner().execute(["true"])
+    # outside of any stage, so it isn't counted anywhere
+    Runner().execute(["true"])
+    run_report.end_publication("book", 0)
+
+    report = run_report.describe()
+    assert report["subprocesses"] == 2
+    assert report["publications"]["book"]["stages"]["rasterise"]["subprocesses"] == 2
+
+
+def test_run_stages_count_towards_the_totals_only(run_report, tmp_path):
+    with run_report.measure(None, "setup"):
+        Runner().execute(["true"])
+    run_report.begin_publication("book", str(tmp_path))
+    with run_report.measure("book", "ocr"):
+        Runner().execute(["true"])
+    run_report.end_publication("book", 0)
+    run_report.retire_publications(0)
+
+    report = run_report.describe()
+    assert report["subprocesses"] == 2
+    assert report["stages"]["setup"]["subprocesses"] == 1
+    assert report["stages"]["ocr"]["subprocesses"] == 1
+    assert report["publications"] == dict()
+    assert report["retired_publications"] == 1
@@ -0,0 +1,54 @@
+import threading
+import time
+
+import pytest
+
+from generate import Options, Scheduler
+
+
+@pytest.fixture
+def scheduler(tmp_path):
+    options = Options()
+    options.output_root_path = str(tmp_path)
+    options.job_count = 4
+    options.ocr_backend = "command"
+    options.use_ocr_cache = False
+    options.generate_library_search = False
+    options.generate_structure = False
+    options.generate_meta_from_isbn = False
+    scheduler = Scheduler(options)
+    yield scheduler
+    scheduler.shutdown()
+
+
+def test_every_page_is_run(scheduler):
+    finished_pages = list[int]()
+    finished_pages_lock = threading.Lock()
+
+    def run_page(page_index: int) -> None:
+        with finished_pages_lock:
+            finished_pages.append(page_index)
+
+    scheduler.run_pages(run_page, [[page_index] for page_index in range(20)])
+    assert sorted(finished_pages) == list(range(20))
+
+
+def test_failed_page_stops_the_rest_before_raising(scheduler):
+    finished_pages = list[int]()
+    finished_pages_lock = threading.Lock()
+
+    def run_page(page_index: int) -> None:
+        if page_index == 2:
+            time.sleep(0.05)
+            raise RuntimeError("page 2 failed")
+        time.sleep(0.2)
+        with finished_pages_lock:
+            finished_pages.append(page_index)
+
+    with pytest.raises(RuntimeError):
+        scheduler.run_pages(run_page, [[page_index] for page_index in range(20)])
+    # the pages already running are waited for, the queued ones never start
+    finished_pages_at_raise = sorted(finished_pages)
+    assert finished_pages_at_raise == [0, 1, 3]
+    time.sleep(0.5)
+    assert sorted(finished_pages) == finished_pages_at_raise
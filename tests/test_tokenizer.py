@@ -0,0 +1,51 @@
+import pytest
+
+from generate import Extractor, Tokenizer
+from synthetic import write_page_txts
+from tokenizer import legacy_count_words
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "The quick brown Fox, jumps! over 42 dogs",
+        "ISBN-13: 978-0-306-40615-7",
+        "$5 @home. e-mail: someone@example.com",
+        "Über naïve café İstanbul",
+        "tabs\tand\u00a0non breaking\u2003spaces\nand lines",
+        "!!! ??? --- ... ,,,",
+        "",
+    ],
+)
+def test_tokenize_matches_legacy_filter(tmp_path, text):
+    txt_file_path = tmp_path / "page0000.txt"
+    txt_file_path.write_text(text)
+    count_by_word = Tokenizer().count_words_in_file(str(txt_file_path))
+    assert dict(count_by_word) == legacy_count_words(str(txt_file_path))
+
+
+def test_word_frequencies_match_legacy_filter(tmp_path):
+    write_page_txts(str(tmp_path), 20, 500)
+    count_by_word_by_page_stem_name = Extractor().calculate_word_frequencies_by_page(
+        str(tmp_path)
+    )
+    assert len(count_by_word_by_page_stem_name) == 20
+    for page_stem_name, count_by_word in count_by_word_by_page_stem_name.items():
+        page_txt_file_path = tmp_path / "".join([page_stem_name, ".txt"])
+        assert dict(count_by_word) == legacy_count_words(str(page_txt_file_path))
+
+
+def test_blocks_never_split_a_word(tmp_path):
+    txt_file_path = tmp_path / "page0000.txt"
+    txt_file_path.write_text("\n".join(["alpha beta gamma"] * 1000))
+    tokenizer = Tokenizer()
+    count_by_word = count_words_in_blocks(tokenizer, str(txt_file_path), 64)
+    assert count_by_word == {"alpha": 1000, "beta": 1000, "gamma": 1000}
+
+
+def count_words_in_blocks(tokenizer: Tokenizer, txt_file_path: str, block_size: int) -> dict:
+    count_by_word = dict()
+    for line_block in tokenizer.read_line_blocks(txt_file_path, block_size):
+        for word in tokenizer.tokenize(line_block):
+            count_by_word[word] = count_by_word.get(word, 0) + 1
+    return count_by_word